@@ -1,82 +1,74 @@
 import streamlit as st
-import xml.etree.ElementTree as ET
-import requests
+import uuid
+import app_ui
+import job_queue
+import llm_client
+import local_answers
+import perf
+import response_cache
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+llm_cache = response_cache.get_cache()
+jobs = job_queue.get_queue()
+# Sessions share the job workers, which take their jobs in turn
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+recorder = perf.Recorder("app", trace_memory=st.session_state.get("trace_memory", perf.TRACE_MEMORY))
+perf.serve_metrics()
 
-# Parse test results from XML
-
-def parse_test_results(xml_file):
-    try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        total_tests = int(root.get("tests", 0))
-        total_failures = int(root.get("failures", 0))
-
-        results = "Test Case Details:\n"
-        for testcase in root.findall("testcase"):
-            name = testcase.get("name", "N/A")
-            classname = testcase.get("classname", "N/A")
-            time = testcase.get("time", "N/A")
-            failure = testcase.find("failure")
-            status = "FAILED" if failure is not None else "PASSED"
-            results += f'<testcase name="{name}"\n          classname="{classname}"\n          time="{time}"\n          status="{status}" />\n'
-
-        results += f"\nSummary:\nTotal Test Cases: {total_tests}\nFailed Test Cases: {total_failures}\nPassed Test Cases: {total_tests - total_failures}\n"
-
-        return results
-
-    except ET.ParseError as e:
-        st.error(f"Error parsing XML: {e}")
-    except Exception as e:
-        st.error(f"Unexpected error: {e}")
-
-# Push data to Ollama
-def push_to_ollama(data):
-    try:
-        payload = {
-            "model": "llama3",
-            "prompt": f"Index the following test results for semantic search:\n{data}",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            st.success("Data pushed to Ollama successfully!")
-        else:
-            st.error(f"Failed to push data to Ollama: {response.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Request error: {e}")
-
-# Query Ollama
-def query_ollama(question):
-    try:
-        payload = {
-            "model": "tinyllama:1.1b",
-            "prompt": f"Based on the indexed test results, answer this question: {question}",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            return response.json().get("response", "No response received.")
-        else:
-            st.error(f"Failed to query Ollama: {response.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Request error: {e}")
+# Model profile for this request; the embedding model indexes and retrieves
+profiles = llm_client.answer_profiles()
+profile = st.sidebar.selectbox("Model profile", profiles, index=profiles.index("quick"))
+llm, model = llm_client.resolve(profile)
+embedder, embed_model = llm_client.resolve("embed")
+# Load both models in the background before the first request needs them
+llm_client.warm_up([profile, "embed"])
+# Parsing, the test case table and the Ollama calls, shared with the other
+# result pages
+page = app_ui.ResultsPage(
+    recorder, llm, model, embedder, embed_model, jobs, session_id, llm_cache
+)
 
 # Streamlit UI
 st.title("Json Ollama parser")
 
-uploaded_file = st.file_uploader("Upload XML Test Results", type="xml")
+uploaded_files = st.file_uploader("Upload XML Test Results", type=["xml", "zip"], accept_multiple_files=True)
 
-if uploaded_file is not None:
-    results = parse_test_results(uploaded_file)
-    st.text_area("Parsed Test Results:", results, height=300)
-    if st.button("Push to Ollama"):
-        push_to_ollama(results)
+results = None
+diff = None
+if uploaded_files:
+    results = page.parse_test_results(uploaded_files)
+    if results is not None:
+        diff = page.track_previous_run(results)
+        st.write("Parsed Test Results:")
+        page.show_test_cases(results)
+        st.caption(
+            f"{results['Total Tests']} tests: {results['Passed Tests']} passed, "
+            f"{results['Failed Tests']} failed, {results['Skipped Tests']} skipped"
+        )
+        if diff is not None:
+            st.caption(diff.summary())
+        if st.button("Push to Ollama"):
+            page.push_to_ollama(results, diff)
+        pushed = page.finished_job("push_job", "Failed to push data to Ollama")
+        if pushed is not None:
+            st.session_state["index_path"] = pushed.result
+            st.success(f"Data pushed to Ollama successfully! ({pushed.message})")
 
 st.subheader("Ask Questions About the Test Results:")
 question = st.text_input("Enter your question:")
 if st.button("Query Ollama"):
     if question:
-        answer = query_ollama(question)
-        st.text_area("Answer:", answer, height=200)
+        answer = page.query_ollama(question, results, diff)
+        if answer is not None:
+            # Any widget click reruns the script, which closes the stream and stops generation
+            st.button("Stop")
+            st.write_stream(answer)
+            st.caption(llm_client.format_stream_stats(answer.stats))
+            st.caption(local_answers.format_routes(answer.stats))
+            st.caption(response_cache.format_stats(llm_cache.stats()))
+
+# Performance panel: per-stage timings for this run of the page
+with st.expander("Performance"):
+    st.checkbox("Trace memory (slower)", key="trace_memory")
+    st.dataframe(recorder.rows())
+    st.write("Model load and eval time:")
+    st.dataframe(llm.timings.rows())
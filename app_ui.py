@@ -0,0 +1,297 @@
+import streamlit as st
+import os
+import xml.etree.ElementTree as ET
+import requests
+import failure_triage
+import junit_parser
+import llm_client
+import local_answers
+import perf
+import response_cache
+import results_table
+import retrieval
+import run_diff
+import table_view
+
+# The parts of the JUnit pages (app, cc, llama and plotly) that are the same
+# on every page: parsing, the test case table, run history, the previous run
+# and what changed since it, failure triage, pushing to Ollama and asking it
+# questions, and the background jobs behind them. Each page builds one
+# ResultsPage from its own models and stores and lays out its own UI.
+
+
+# Parse test results from XML, for every XML app. Errors are shown on the
+# page and give None.
+def parse_test_results(recorder, xml_files):
+    try:
+        with recorder.stage("parse"):
+            results = junit_parser.parse_test_runs(xml_files)
+        # The counted totals are used; flag a report whose own totals disagree
+        for mismatch in junit_parser.reconcile_totals(results):
+            st.warning(mismatch)
+        return results
+
+    except ET.ParseError as e:
+        st.error(f"Error parsing XML: {e}")
+    except Exception as e:
+        st.error(f"Unexpected error: {e}")
+
+# Re-check a running background job every second without rerunning the
+# page, and rerun the page once it has finished so its result is picked up
+@st.fragment(run_every=1.0)
+def poll_job(jobs, job_id):
+    job = jobs.get(job_id)
+    if job is None or job.finished():
+        st.rerun()
+    st.progress(job.fraction(), text=job.describe())
+    if st.button("Cancel", key=f"cancel-{job_id}"):
+        jobs.cancel(job_id)
+
+# A recorder for the stages a background job times on its worker thread. The
+# page run that submitted the job has rendered its panel by then, so the
+# records are kept on the job and shown by the run that picks it up.
+def job_recorder(recorder, job):
+    timings = perf.Recorder(recorder.app, trace_memory=recorder.trace_memory)
+    job.records = timings.records
+    return timings
+
+# The background job kept under `name` in session state, once it has
+# succeeded. Until then its progress is shown, or its error if it failed.
+# With a recorder, the job's stage timings are added to it once it finishes.
+def finished_job(jobs, name, failure, recorder=None):
+    job = jobs.get(st.session_state.get(name))
+    if job is None:
+        return None
+    if recorder is not None and job.finished() and st.session_state.get(f"{name}_recorded") != job.id:
+        st.session_state[f"{name}_recorded"] = job.id
+        recorder.extend(job.records)
+    if not job.finished():
+        poll_job(jobs, job.id)
+    elif job.status == "cancelled":
+        st.info(f"{job.label} cancelled.")
+    elif isinstance(job.error, requests.exceptions.HTTPError):
+        st.error(f"{failure}: {job.error.response.text}")
+    elif isinstance(job.error, requests.exceptions.RequestException):
+        st.error(f"Request error: {job.error}")
+    elif job.error is not None:
+        st.error(f"{failure}: {job.error}")
+    return job if job.status == "done" else None
+
+
+class ResultsPage:
+    # subject names what the model is told it is answering from, which for
+    # llama includes the graph summaries pushed with the results
+    def __init__(self, recorder, llm, model, embedder, embed_model, jobs, session_id, llm_cache,
+                 history=None, subject="test results"):
+        self.recorder = recorder
+        self.llm = llm
+        self.model = model
+        self.model_name = llm_client.model_key(llm, model)
+        self.embedder = embedder
+        self.embed_model = embed_model
+        self.jobs = jobs
+        self.session_id = session_id
+        self.llm_cache = llm_cache
+        self.history = history
+        self.subject = subject
+
+    def parse_test_results(self, xml_files):
+        return parse_test_results(self.recorder, xml_files)
+
+    # Test cases one page at a time, filtered and sorted on the server, so only
+    # the rows on screen are sent to the browser
+    def show_test_cases(self, results):
+        table = results["Test Cases"]
+        # The view keeps its sort orders and name index, so build it once per upload
+        view = st.session_state.get("table_view")
+        if view is None or view[0] != table.fingerprint():
+            view = st.session_state["table_view"] = (table.fingerprint(), table_view.TableView(table))
+        view = view[1]
+        status_column, text_column, sort_column = st.columns(3)
+        statuses = status_column.multiselect("Status", results_table.OUTCOMES)
+        text = text_column.text_input("Classname or name contains")
+        sort = sort_column.selectbox("Sort by", table_view.SORTS)
+        min_column, max_column, order_column = st.columns(3)
+        min_time = min_column.number_input("Min time (s)", min_value=0.0, value=None)
+        max_time = max_column.number_input("Max time (s)", min_value=0.0, value=None)
+        descending = order_column.checkbox("Descending")
+        with self.recorder.stage("table query"):
+            rows = view.query(statuses, text, min_time, max_time, sort, descending)
+        pages = table_view.page_count(rows)
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+        with self.recorder.stage("table page"):
+            st.dataframe(view.page(rows, page - 1))
+        st.caption(f"{len(rows)} of {len(table)} test cases")
+
+    # Record the run in the history store and show how it compares with earlier runs
+    def show_run_history(self, results, uploaded_files):
+        with self.recorder.stage("history ingest"):
+            run_id = self.history.ingest(results, label=", ".join(f.name for f in uploaded_files))
+        with st.expander("Run History"):
+            with self.recorder.stage("history queries"):
+                slowdowns = self.history.slowdowns(run_id)
+                flaky = self.history.flaky_tests()
+            st.write("Slower than usual in this run:")
+            st.dataframe(slowdowns)
+            st.write("Flaky tests over the last 50 runs:")
+            st.dataframe(flaky)
+
+    # Keep the previous upload so a re-run can be compared with it, along with
+    # the index pushed for it, which the new index is built from incrementally
+    def track_previous_run(self, results):
+        fingerprint = results["Test Cases"].fingerprint()
+        current = st.session_state.get("current_run")
+        if current is None or current["fingerprint"] != fingerprint:
+            if current is not None:
+                current["index_path"] = st.session_state.pop("index_path", None)
+                # A job still running for the old upload no longer applies to this one
+                st.session_state.pop("push_job", None)
+                st.session_state.pop("triage_job", None)
+            st.session_state["previous_run"] = current
+            st.session_state["current_run"] = {"fingerprint": fingerprint, "results": results}
+        previous = st.session_state["previous_run"]
+        if previous is None:
+            return None
+        key = (previous["fingerprint"], fingerprint)
+        cached = st.session_state.get("run_diff")
+        if cached is None or cached[0] != key:
+            with self.recorder.stage("diff"):
+                diff = run_diff.diff_runs(previous["results"]["Test Cases"], results["Test Cases"])
+            cached = st.session_state["run_diff"] = (key, diff)
+        return cached[1]
+
+    # What changed since the previous upload, explained from the changed tests only
+    def show_changes(self, diff):
+        with st.expander("Changes Since Previous Upload"):
+            st.write(diff.summary())
+            st.dataframe(diff.rows(limit=500))
+            if st.button("Explain changes"):
+                answer = self.explain_changes(diff)
+                if answer is not None:
+                    st.write_stream(answer)
+                    st.caption(llm_client.format_stream_stats(answer.stats))
+
+    def explain_changes(self, diff):
+        try:
+            prompt = diff.prompt()
+            answer = response_cache.cached_stream(
+                self.llm_cache, self.model_name, prompt, "", lambda: self.llm.stream_generate(self.model, prompt)
+            )
+            return self.recorder.track_stream("explain changes", answer, self.model_name)
+        except requests.exceptions.HTTPError as e:
+            st.error(f"Failed to query Ollama: {e.response.text}")
+        except requests.exceptions.RequestException as e:
+            st.error(f"Request error: {e}")
+
+    # Group failures by likely root cause and explain each cause once
+    def show_failure_triage(self, results):
+        if not results["Failed Tests"]:
+            return
+        table = results["Test Cases"]
+        with st.expander("Failure Triage"):
+            # Clusters are kept per upload so explanations survive reruns
+            triage = st.session_state.get("triage")
+            if triage is None or triage[0] != table.fingerprint():
+                with self.recorder.stage("triage clustering"):
+                    clusters, _ = failure_triage.cluster_failures(table)
+                triage = st.session_state["triage"] = (table.fingerprint(), clusters)
+            clusters = triage[1]
+            st.write(f"{results['Failed Tests']} failures from {len(clusters)} distinct causes")
+            limit = st.number_input("Causes to explain", min_value=1, max_value=len(clusters), value=min(20, len(clusters)))
+            if st.button("Explain causes"):
+                self.explain_causes(table, clusters, limit)
+            explained = self.finished_job("triage_job", "Failed to explain failure causes")
+            if explained is not None:
+                failure_triage.apply_explanations(clusters, explained.result)
+            st.dataframe(failure_triage.cluster_rows(clusters))
+            st.write("Failed tests and their cause:")
+            st.dataframe(failure_triage.member_rows(table, clusters))
+
+    # Explain the causes as a background job. The job works on its own copy of
+    # the clusters and hands back the explanations by signature. Clicking the
+    # button again after a failure retries it.
+    def explain_causes(self, table, clusters, limit):
+        def explain(job):
+            work = [dict(cluster) for cluster in clusters]
+            with job_recorder(self.recorder, job).stage("triage explanations"):
+                failure_triage.explain_clusters(
+                    self.llm, self.model, work, cache=self.llm_cache, limit=limit, progress=job.report
+                )
+            return failure_triage.explanations(work)
+
+        key = f"triage:{self.model_name}:{table.fingerprint()}:{limit}"
+        st.session_state["triage_job"] = self.jobs.submit(
+            key, explain, owner=self.session_id, label="Explaining failure causes", retry=True
+        ).id
+
+    # Index test results for retrieval through Ollama embeddings. This runs as a
+    # background job, so the page stays responsive and a rerun does not restart it.
+    # Only the button calls this, so a push that failed is retried.
+    def push_to_ollama(self, results, diff=None, extra_texts=()):
+        # A re-run only embeds the chunks whose tests changed since the previous upload
+        base_path = stable = None
+        if diff is not None:
+            base_path, stable = st.session_state["previous_run"].get("index_path"), diff.stable()
+
+        def build(job):
+            with job_recorder(self.recorder, job).stage("embed and index"):
+                index = retrieval.index_test_results(
+                    self.embedder, results, extra_texts=extra_texts, model=self.embed_model,
+                    base_path=base_path, stable=stable,
+                    progress=lambda done, total: job.report(done, total, f"{done} of {total} chunks embedded"),
+                )
+            job.message = f"{index.embedded} of {len(index)} chunks embedded"
+            return index.path
+
+        key = f"index:{llm_client.model_key(self.embedder, self.embed_model)}:{results['Test Cases'].fingerprint()}"
+        st.session_state["push_job"] = self.jobs.submit(
+            key, build, owner=self.session_id, label="Embedding test results", retry=True
+        ).id
+
+    def finished_job(self, name, failure):
+        return finished_job(self.jobs, name, failure, self.recorder)
+
+    # Query Ollama, streaming the answer back token by token. Aggregate questions
+    # are answered locally from the results, and repeated questions about the same
+    # indexed data are served from the response cache. Before anything is
+    # pushed, answers are cached against the parsed results instead. The prompt
+    # carries the summary of changes, so the runs compared are part of the key.
+    def query_ollama(self, question, results=None, diff=None):
+        # The index store is bounded, so the index pushed earlier may be gone
+        if "index_path" in st.session_state and not os.path.isdir(st.session_state["index_path"]):
+            del st.session_state["index_path"]
+            st.info("The pushed test data has been cleared from the index store; push it again to answer from it.")
+        try:
+            dataset = st.session_state.get("index_path") or ""
+            if results is not None:
+                dataset += f"|{results['Test Cases'].fingerprint()}"
+            if diff is not None:
+                dataset += f"|since {st.session_state['previous_run']['fingerprint']}"
+            answer = local_answers.route_question(
+                question, results,
+                lambda: response_cache.cached_stream(
+                    self.llm_cache, self.model_name, question, dataset, lambda: self.generate_answer(question, diff)
+                ),
+            )
+            return self.recorder.track_stream("answer", answer, self.model_name)
+        except requests.exceptions.HTTPError as e:
+            st.error(f"Failed to query Ollama: {e.response.text}")
+        except requests.exceptions.RequestException as e:
+            st.error(f"Request error: {e}")
+
+    # Ask Ollama, with retrieved context once the results have been pushed
+    def generate_answer(self, question, diff=None):
+        changes = f"{diff.summary()}\n\n" if diff is not None else ""
+        if "index_path" not in st.session_state:
+            return self.llm.stream_generate(
+                self.model,
+                f"{changes}Based on the indexed {self.subject}, answer this question: {question}",
+            )
+        # Send only the chunks most relevant to the question
+        index = retrieval.open_index(st.session_state["index_path"])
+        with self.recorder.stage("retrieve context"):
+            context = retrieval.retrieve_context(self.embedder, index, question, model=self.embed_model)
+        return self.llm.stream_generate(
+            self.model,
+            f"Based on these {self.subject}:\n{context}\n\n{changes}Answer this question: {question}",
+        )
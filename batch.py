@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import junit_parser
+import summaries
+
+# Headless parse -> summarise -> LLM digest pipeline for CI and artifact
+# backlogs. Every input (an XML file, a zip of shards or a directory of them)
+# is one run; runs are processed in a pool of worker processes and written
+# out as JSON or Parquet. Nothing here imports Streamlit, pandas or plotly,
+# and requests, pyarrow and the history store are only imported when the
+# options that need them are used. Runs are parsed without the columnar
+# store: each one is read once, and the store would need pyarrow and leave
+# a .columnar_store directory behind.
+#
+#   python batch.py builds/*.xml artifacts/ --workers 8 --output runs.json
+#   python batch.py runs/*.zip --digest --model llama3 --output runs.parquet
+#   python batch.py builds/ --triage --model llama3 --output causes.json
+#   python batch.py nightly-1.xml nightly-2.xml --diff --digest --output changes.json
+
+DIGEST_PROMPT = (
+    "Write a short digest of this test run for a CI report: what failed, "
+    "anything that stands out about timings, and where to look first.\n\n{summary}\n{failures}"
+)
+
+
+# Parse and summarise one run. Returns the output record, plus the parsed
+# results when they are needed back in the parent for the history store.
+# With triage, failures are also clustered by cause here in the worker.
+def process_run(source, max_failures=50, keep_results=False, triage=False):
+    started = time.perf_counter()
+    try:
+        results = junit_parser.parse_test_runs(source, max_workers=1, store=False)
+    # ValueError covers attributes that are not numbers, such as a bad time
+    except (ET.ParseError, OSError, zipfile.BadZipFile, ValueError) as e:
+        return {"source": os.fspath(source), "error": f"{type(e).__name__}: {e}"}, None
+
+    table = results["Test Cases"]
+    stats = table.stats()
+    failed = [
+        {
+            "test": f"{table.classnames[table.classname_codes[i]]}.{table.names[i]}",
+            "suite": table.suites[table.suite_codes[i]],
+            "type": table.types[table.type_codes[i]],
+            "message": table.messages[i],
+        }
+        for i in table.failed.nonzero()[0][:max_failures]
+    ]
+    record = {
+        "source": os.fspath(source),
+        "total_tests": results["Total Tests"],
+        "failed_tests": results["Failed Tests"],
+        "passed_tests": results["Passed Tests"],
+        "error_tests": results["Error Tests"],
+        "skipped_tests": results["Skipped Tests"],
+        "totals_mismatch": junit_parser.reconcile_totals(results),
+        "avg_time": stats["avg_time"],
+        "max_time": stats["max_time"],
+        "min_time": stats["min_time"],
+        "summary": summaries.generate_graph_summaries(results),
+        "failures": failed,
+        "parse_seconds": round(time.perf_counter() - started, 4),
+    }
+    if triage:
+        import failure_triage
+
+        clusters, _ = failure_triage.cluster_failures(table)
+        record["causes"] = [
+            {field: value for field, value in cluster.items() if field != "members"} for cluster in clusters[:max_failures]
+        ]
+    return record, results if keep_results else None
+
+
+# Run process_run over every source, in a process pool when there is more
+# than one. Records come back in input order.
+def run_pipeline(sources, workers=None, max_failures=50, keep_results=False, progress=None, triage=False):
+    outputs = [None] * len(sources)
+    workers = min(len(sources), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        for i, source in enumerate(sources):
+            outputs[i] = process_run(source, max_failures, keep_results, triage)
+            if progress:
+                progress(outputs[i][0])
+        return outputs
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_run, source, max_failures, keep_results, triage): i for i, source in enumerate(sources)
+        }
+        for future in as_completed(futures):
+            outputs[futures[future]] = future.result()
+            if progress:
+                progress(outputs[futures[future]][0])
+    return outputs
+
+
+# Ask the model for a digest of every successfully parsed run, concurrently
+# on the client's worker pool
+def add_digests(records, spec, host, max_concurrency=4):
+    import asyncio
+
+    import llm_client
+
+    client, model = llm_client.open_backend(spec, host, max_concurrency=max_concurrency)
+    parsed = [record for record in records if "error" not in record]
+    prompts = [DIGEST_PROMPT.format(summary=record["summary"], failures=_digest_failures(record)) for record in parsed]
+    try:
+        responses = asyncio.run(client.generate_many(model, prompts))
+    finally:
+        client.close()
+    for record, response in zip(parsed, responses):
+        if isinstance(response, Exception):
+            record["digest_error"] = f"{type(response).__name__}: {response}"
+        else:
+            record["digest"] = response.get("response", "")
+
+
+# A run compared with the one before it is digested from its changes only
+def _digest_failures(record):
+    if "changed_tests" in record:
+        lines = [
+            f"{change['test']}: {change['change']}" + (f": {change['message']}" if change["message"] else "")
+            for change in record["changed_tests"]
+        ]
+        return f"{record['changes_summary']}\nChanged tests:\n" + "\n".join(lines)
+    return "Failed tests:\n" + "\n".join(f"{failure['test']}: {failure['message']}" for failure in record["failures"])
+
+
+# Compare each run with the run before it on the command line, for a series
+# of re-runs of one suite
+def add_changes(outputs, max_failures=50):
+    import run_diff
+
+    previous = None
+    for record, results in outputs:
+        if results is None:
+            continue
+        if previous is not None:
+            diff = run_diff.diff_runs(previous["Test Cases"], results["Test Cases"])
+            record["changes"] = diff.counts()
+            record["changes_summary"] = diff.summary()
+            record["changed_tests"] = diff.rows(max_failures)
+        previous = results
+
+
+# Explain the failure causes of every run, one request per distinct cause
+# across the whole batch, and replace them with their output rows
+def add_explanations(records, spec, host, max_concurrency=4):
+    import failure_triage
+    import llm_client
+
+    causes = [cause for record in records for cause in record.get("causes", ())]
+    client, model = llm_client.open_backend(spec, host, max_concurrency=max_concurrency)
+    try:
+        failure_triage.explain_clusters(client, model, causes)
+    finally:
+        client.close()
+    for record in records:
+        if "causes" in record:
+            record["causes"] = failure_triage.cluster_rows(record["causes"])
+
+
+def write_records(records, output):
+    if output and output.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Error and digest fields only exist on some records, so take the
+        # columns from all of them rather than from the first
+        columns = dict.fromkeys(key for record in records for key in record)
+        pq.write_table(pa.table({key: [record.get(key) for record in records] for key in columns}), output)
+        return
+    text = json.dumps(records, indent=2)
+    if not output or output == "-":
+        print(text)
+        return
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse, summarise and optionally digest JUnit runs without the UI.")
+    parser.add_argument("sources", nargs="+", help="XML files, zip archives or directories; each one is a run")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--output", "-o", default="-", help="output path; .parquet writes Parquet, anything else JSON")
+    parser.add_argument("--max-failures", type=int, default=50, help="failed test names kept per run")
+    parser.add_argument("--digest", action="store_true", help="ask the model for a digest of each run")
+    parser.add_argument("--model", default="deep", help='model profile or "provider:model" (ollama, gemini or fake)')
+    parser.add_argument("--host", default=os.environ.get("OLLAMA_HOST", "http://localhost:11434"), help="Ollama server")
+    parser.add_argument("--concurrency", type=int, default=4, help="digest requests in flight at once")
+    parser.add_argument("--triage", action="store_true", help="cluster failures by cause and ask the model to explain each cause")
+    parser.add_argument("--diff", action="store_true", help="compare each run with the one before it; digests then cover the changes only")
+    parser.add_argument("--record", action="store_true", help="add each run to the run history store")
+    parser.add_argument("--quiet", "-q", action="store_true")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+
+    def progress(record):
+        if not args.quiet:
+            status = record.get("error") or f"{record['total_tests']} tests, {record['failed_tests']} failed"
+            print(f"{record['source']}: {status}", file=sys.stderr)
+
+    outputs = run_pipeline(args.sources, args.workers, args.max_failures, args.record or args.diff, progress, args.triage)
+    records = [record for record, _ in outputs]
+
+    if args.record:
+        import run_history
+
+        history = run_history.get_history()
+        for record, results in outputs:
+            if results is not None:
+                record["run_id"] = history.ingest(results, label=record["source"])
+
+    if args.diff:
+        add_changes(outputs, args.max_failures)
+
+    if args.digest:
+        add_digests(records, args.model, args.host, args.concurrency)
+
+    if args.triage:
+        add_explanations(records, args.model, args.host, args.concurrency)
+
+    write_records(records, args.output)
+    if not args.quiet:
+        print(f"{len(records)} runs in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 1 if any("error" in record for record in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# Benchmarks for the parsing, aggregation, prompt and LLM stages on synthetic
+# inputs, with the LLM stages run against the stub Ollama server or, with
+# --llm-backend fake, the in-process fake backend. Results are written as
+# JSON (latency percentiles, throughput and peak memory per stage) so runs
+# from two versions can be compared with --compare.
+#
+#   python benchmarks.py --tests 50000 --rows 50000 --output bench.json
+#   python benchmarks.py --output new.json --compare bench.json
+
+# The columnar store and history go to a scratch directory so benchmarks never
+# touch (or get sped up by) the real caches; set before the modules load
+_SCRATCH = tempfile.mkdtemp(prefix="bench-")
+os.environ["COLUMNAR_STORE_DIR"] = os.path.join(_SCRATCH, "store")
+os.environ["RUN_HISTORY_PATH"] = os.path.join(_SCRATCH, "history.sqlite3")
+os.environ["RESPONSE_CACHE_PATH"] = os.path.join(_SCRATCH, "responses.sqlite3")
+os.environ["RETRIEVAL_INDEX_DIR"] = os.path.join(_SCRATCH, "index")
+
+import chart_data
+import excel_reader
+import failure_triage
+import junit_parser
+import llm_client
+import prompt_context
+import response_cache
+import retrieval
+import run_history
+import summaries
+import synthetic_data
+import table_view
+import wire_format
+from content_cache import ContentCache
+from mock_ollama import start_stub_server
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# Time fn() `repeat` times after `warmup` untimed calls. setup() runs before
+# each call, outside the timing. `items` is how many units one call handles,
+# for throughput. A final traced call measures peak Python allocations.
+def measure(fn, repeat=5, warmup=1, setup=None, items=1, unit="items"):
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        traced_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings = np.array(timings) * 1000
+    return {
+        "runs": repeat,
+        "items": items,
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p90_ms": round(float(np.percentile(timings, 90)), 3),
+        "p99_ms": round(float(np.percentile(timings, 99)), 3),
+        "mean_ms": round(float(timings.mean()), 3),
+        "min_ms": round(float(timings.min()), 3),
+        "max_ms": round(float(timings.max()), 3),
+        "throughput": round(items / (float(np.median(timings)) / 1000), 1),
+        "throughput_unit": f"{unit}/s",
+        "traced_peak_mb": round(traced_peak / (1024 * 1024), 2),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+# Per-request latencies from one batch of requests, as percentiles
+def latency_stats(latencies, elapsed, unit="requests"):
+    latencies = np.array(latencies) * 1000
+    return {
+        "runs": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "throughput_unit": f"{unit}/s",
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _clear_store():
+    shutil.rmtree(os.environ["COLUMNAR_STORE_DIR"], ignore_errors=True)
+
+
+def bench_junit(args, workdir):
+    stages = {}
+    flat = os.path.join(workdir, "flat.xml")
+    nested = os.path.join(workdir, "nested.xml")
+    synthetic_data.write_junit_xml(flat, args.tests, args.failure_ratio, args.failure_body, seed=args.seed)
+    synthetic_data.write_junit_xml(
+        nested, args.tests, args.failure_ratio, args.failure_body, suites=args.suites, depth=args.depth, seed=args.seed
+    )
+    shards = os.path.join(workdir, "shards")
+    os.makedirs(shards)
+    per_shard = max(1, args.tests // args.shards)
+    for i in range(args.shards):
+        synthetic_data.write_junit_xml(
+            os.path.join(shards, f"shard{i}.xml"), per_shard, args.failure_ratio, args.failure_body, seed=args.seed + i
+        )
+
+    def parse(path):
+        return junit_parser.parse_test_results(path, cache=ContentCache())
+
+    size_mb = os.path.getsize(flat) / (1024 * 1024)
+    stages["junit_parse_cold"] = measure(lambda: parse(flat), args.repeat, setup=_clear_store, items=args.tests, unit="tests")
+    stages["junit_parse_cold"]["input_mb"] = round(size_mb, 2)
+    stages["junit_parse_store_reload"] = measure(lambda: parse(flat), args.repeat, items=args.tests, unit="tests")
+    stages["junit_parse_nested"] = measure(lambda: parse(nested), args.repeat, setup=_clear_store, items=args.tests, unit="tests")
+    stages["junit_parse_nested"]["tests_parsed"] = len(parse(nested)["Test Cases"])
+    stages["junit_parse_shards"] = measure(
+        lambda: junit_parser.parse_test_runs(shards, cache=ContentCache(), max_workers=args.workers),
+        args.repeat, setup=_clear_store, items=per_shard * args.shards, unit="tests",
+    )
+
+    results = parse(flat)
+    table = results["Test Cases"]
+    stages["frame_build"] = measure(lambda: table[:].to_frame(), args.repeat, items=len(table), unit="rows")
+    stages["summary"] = measure(lambda: summaries.generate_graph_summaries(results), args.repeat, items=len(table), unit="rows")
+
+    def chart_payload():
+        frames = (
+            chart_data.top_slowest(table, 50),
+            chart_data.classname_rollup(table),
+            chart_data.time_histogram(table),
+            chart_data.time_series(table),
+            chart_data.status_counts(table),
+        )
+        return sum(len(frame.to_json(orient="records")) for frame in frames)
+
+    stages["chart_payload"] = measure(chart_payload, args.repeat, items=len(table), unit="rows")
+    stages["chart_payload"]["payload_bytes"] = chart_payload()
+
+    # The whole run as prompt text: the repr of the records, as prompts used
+    # to embed them, against the compact wire format
+    for name, encode in (("prompt_repr", str), ("prompt_wire", wire_format.encode_test_cases)):
+        stages[name] = measure(lambda: encode(results), args.repeat, items=len(table), unit="tests")
+        text = encode(results)
+        stages[name]["chars"] = len(text)
+        stages[name]["tokens_per_test"] = round(prompt_context.count_tokens(text) / len(table), 2)
+    stages["retrieval_chunks"] = measure(
+        lambda: retrieval.chunk_test_results(results), args.repeat, items=len(table), unit="rows"
+    )
+    stages["failure_triage"] = measure(
+        lambda: failure_triage.cluster_failures(table), args.repeat, items=results["Failed Tests"], unit="failures"
+    )
+    stages["failure_triage"]["clusters"] = len(failure_triage.cluster_failures(table)[0])
+
+    # Sort orders and the name index are built once per upload; each filter
+    # change after that is one query plus one page
+    def build_view():
+        view = table_view.TableView(table)
+        for sort in table_view.SORTS:
+            view.order(sort)
+        view.query(text="x")
+        return view
+
+    stages["table_view_build"] = measure(build_view, args.repeat, items=len(table), unit="rows")
+    view = build_view()
+
+    def table_page():
+        view._last = None
+        rows = view.query(["FAILED", "ERROR"], "test_1", None, None, "time", True)
+        return view.page(rows, 0)
+
+    stages["table_view_query"] = measure(table_page, args.repeat, items=len(table), unit="rows")
+    stages["table_view_query"]["payload_bytes"] = len(table_page().to_json(orient="records"))
+
+    # Ingest into an empty history each time, so every test identity is new
+    history = {}
+
+    def fresh_history():
+        path = os.environ["RUN_HISTORY_PATH"]
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        history["store"] = run_history.RunHistory(path)
+
+    stages["history_ingest"] = measure(
+        lambda: history["store"].ingest(results), args.repeat, setup=fresh_history, items=len(table), unit="rows"
+    )
+    return stages, results
+
+
+def bench_excel(args, workdir):
+    stages = {}
+    path = os.path.join(workdir, "audit.xlsx")
+    synthetic_data.write_excel(path, args.rows, args.failure_ratio, seed=args.seed)
+
+    stages["excel_summary_cold"] = measure(
+        lambda: excel_reader.summarize_sheet(path, cache=ContentCache()),
+        args.repeat, warmup=0, setup=_clear_store, items=args.rows, unit="rows",
+    )
+    stages["excel_summary_cold"]["input_mb"] = round(os.path.getsize(path) / (1024 * 1024), 2)
+    summary = excel_reader.summarize_sheet(path, cache=ContentCache())
+    stages["excel_summary_store_reload"] = measure(
+        lambda: excel_reader.summarize_sheet(path, cache=ContentCache()), args.repeat, items=args.rows, unit="rows"
+    )
+    last_page = max(0, args.rows // 100 - 1)
+    stages["excel_page_last"] = measure(lambda: excel_reader.read_sheet_page(path, last_page), args.repeat, unit="pages")
+    stages["excel_prompt_context"] = measure(
+        lambda: prompt_context.build_summary_context(summary, args.budget), args.repeat, items=args.rows, unit="rows"
+    )
+    stages["excel_prompt_context"]["prompt_tokens"] = prompt_context.build_summary_context(summary, args.budget)[1]["tokens"]
+    return stages
+
+
+def bench_llm(args, results):
+    stages = {}
+    server = None
+    # The stub measures the whole HTTP path; the fake backend only the
+    # pipeline's own overhead on top of the backend interface
+    if args.llm_backend == "fake":
+        client = llm_client.FakeBackend(token_delay=args.token_delay, max_concurrency=args.concurrency)
+    else:
+        server, url = start_stub_server(token_delay=args.token_delay)
+        client = llm_client.OllamaClient(url, max_concurrency=args.concurrency)
+    try:
+        # Streamed generation: time to first token and total per request
+        first_token, totals = [], []
+        started = time.perf_counter()
+        for i in range(args.llm_requests):
+            stream = client.stream_generate("llama3", f"question {i} " + "x" * args.prompt_chars)
+            for _ in stream:
+                pass
+            first_token.append(stream.stats["time_to_first_token"])
+            totals.append(stream.stats["elapsed"])
+        elapsed = time.perf_counter() - started
+        stages["llm_stream_ttft"] = latency_stats(first_token, elapsed)
+        stages["llm_stream_total"] = latency_stats(totals, elapsed)
+
+        # Concurrent non-streamed generation on the client's worker pool
+        prompts = [f"digest {i}" for i in range(args.llm_requests)]
+        started = time.perf_counter()
+        asyncio.run(client.generate_many("llama3", prompts))
+        stages["llm_generate_many"] = {
+            "runs": len(prompts),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            "throughput": round(len(prompts) / (time.perf_counter() - started), 1),
+            "throughput_unit": "requests/s",
+            "concurrency": args.concurrency,
+        }
+
+        # Embedding the run for retrieval, cold each time
+        stages["retrieval_index"] = measure(
+            lambda: retrieval.index_test_results(client, results),
+            max(1, args.repeat // 2), warmup=0,
+            setup=lambda: shutil.rmtree(os.environ["RETRIEVAL_INDEX_DIR"], ignore_errors=True),
+            items=len(results["Test Cases"]), unit="rows",
+        )
+
+        # Response cache: the miss stores the answer, the hits are served locally
+        cache = response_cache.ResponseCache(os.environ["RESPONSE_CACHE_PATH"])
+
+        def ask():
+            stream = response_cache.cached_stream(
+                cache, "llama3", "how many failed", "bench", lambda: client.stream_generate("llama3", "how many failed")
+            )
+            for _ in stream:
+                pass
+
+        stages["response_cache_hit"] = measure(ask, args.repeat, unit="requests")
+        if server is not None:
+            stages["stub_requests"] = len(server.requests)
+            stages["llm_model_switching"] = bench_model_switching(args)
+    finally:
+        client.close()
+        if server is not None:
+            server.shutdown()
+    return stages
+
+
+# Requests alternating between two models on a server that holds one at a
+# time, sent concurrently: without scheduling nearly every request reloads a
+# model, with it each model is loaded once per batch of its requests
+def bench_model_switching(args):
+    models = ["llama3", "tinyllama:1.1b"]
+    stages = {}
+    for name, max_loaded_models in (("unscheduled", len(models)), ("scheduled", 1)):
+        server, url = start_stub_server(load_delay=args.load_delay, max_loaded=1)
+        client = llm_client.OllamaClient(url, max_concurrency=args.concurrency, max_loaded_models=max_loaded_models)
+
+        async def run():
+            requests = [client.agenerate(models[i % len(models)], f"question {i}") for i in range(args.llm_requests)]
+            return await asyncio.gather(*requests)
+
+        try:
+            started = time.perf_counter()
+            asyncio.run(run())
+            elapsed = time.perf_counter() - started
+            stages[name] = {
+                "runs": args.llm_requests,
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "model_loads": server.loads,
+                "load_s": round(sum(row["load_s"] for row in client.timings.rows()), 3),
+                "throughput": round(args.llm_requests / elapsed, 1),
+                "throughput_unit": "requests/s",
+            }
+        finally:
+            client.close()
+            server.shutdown()
+    return stages
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# p50 ratio per stage between two result files; below 1.0 is faster
+def compare(current, baseline):
+    lines = [f"{'stage':32} {'baseline p50':>14} {'current p50':>14} {'ratio':>7}"]
+    for stage, metrics in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not isinstance(metrics, dict) or not isinstance(before, dict) or "p50_ms" not in metrics:
+            continue
+        ratio = metrics["p50_ms"] / before["p50_ms"] if before.get("p50_ms") else float("nan")
+        lines.append(f"{stage:32} {before['p50_ms']:>14.3f} {metrics['p50_ms']:>14.3f} {ratio:>7.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing, aggregation, prompt and LLM stages.")
+    parser.add_argument("--tests", type=int, default=20000, help="test cases per synthetic JUnit report")
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument("--failure-body", type=int, default=500, help="bytes of stack trace per failure")
+    parser.add_argument("--suites", type=int, default=20, help="suites in the nested report")
+    parser.add_argument("--depth", type=int, default=2, help="nesting depth of each suite in the nested report")
+    parser.add_argument("--shards", type=int, default=8, help="files in the sharded run")
+    parser.add_argument("--workers", type=int, default=None, help="parse workers for the sharded run")
+    parser.add_argument("--rows", type=int, default=20000, help="rows in the synthetic workbook")
+    parser.add_argument("--budget", type=int, default=prompt_context.TOKEN_BUDGET, help="prompt token budget")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-backend", default="stub", choices=["stub", "fake"], help="stub Ollama server or in-process fake backend")
+    parser.add_argument("--token-delay", type=float, default=0.001, help="seconds per streamed token")
+    parser.add_argument("--load-delay", type=float, default=0.05, help="seconds the stub takes to load a model")
+    parser.add_argument("--prompt-chars", type=int, default=2000)
+    parser.add_argument("--skip", action="append", default=[], choices=["junit", "excel", "llm"])
+    parser.add_argument("--output", "-o", default="-")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = os.path.join(_SCRATCH, "inputs")
+    os.makedirs(workdir)
+    stages = {}
+    try:
+        results = None
+        if "junit" not in args.skip or "llm" not in args.skip:
+            junit_stages, results = bench_junit(args, workdir)
+            if "junit" not in args.skip:
+                stages.update(junit_stages)
+        if "excel" not in args.skip:
+            stages.update(bench_excel(args, workdir))
+        if "llm" not in args.skip:
+            stages.update(bench_llm(args, results))
+    finally:
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "stages": stages,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
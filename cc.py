@@ -1,45 +1,39 @@
 import streamlit as st
-import xml.etree.ElementTree as ET
-import requests
+import uuid
 import plotly.express as px
-import pandas as pd
-
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-
-# Parse test results from XML
-def parse_test_results(xml_file):
-    try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        total_tests = int(root.get("tests", 0))
-        total_failures = int(root.get("failures", 0))
-
-        test_data = []
-        for testcase in root.findall("testcase"):
-            name = testcase.get("name", "N/A")
-            classname = testcase.get("classname", "N/A")
-            time = float(testcase.get("time", 0))
-            failure = testcase.find("failure")
-            status = "FAILED" if failure is not None else "PASSED"
-            test_data.append({"name": name, "classname": classname, "time": time, "status": status})
-
-        results = {
-            "Total Tests": total_tests,
-            "Failed Tests": total_failures,
-            "Passed Tests": total_tests - total_failures,
-            "Test Cases": test_data
-        }
-
-        return results
-
-    except ET.ParseError as e:
-        st.error(f"Error parsing XML: {e}")
-    except Exception as e:
-        st.error(f"Unexpected error: {e}")
+import app_ui
+import chart_data
+import job_queue
+import llm_client
+import local_answers
+import perf
+import response_cache
+import run_history
+
+llm_cache = response_cache.get_cache()
+jobs = job_queue.get_queue()
+# Sessions share the job workers, which take their jobs in turn
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+history = run_history.get_history()
+recorder = perf.Recorder("cc", trace_memory=st.session_state.get("trace_memory", perf.TRACE_MEMORY))
+perf.serve_metrics()
+
+# Model profile for this request; the embedding model indexes and retrieves
+profiles = llm_client.answer_profiles()
+profile = st.sidebar.selectbox("Model profile", profiles, index=profiles.index("deep"))
+llm, model = llm_client.resolve(profile)
+embedder, embed_model = llm_client.resolve("embed")
+# Load both models in the background before the first request needs them
+llm_client.warm_up([profile, "embed"])
+# Parsing, the test case table and the Ollama calls, shared with the other
+# result pages
+page = app_ui.ResultsPage(
+    recorder, llm, model, embedder, embed_model, jobs, session_id, llm_cache, history=history
+)
 
 # Graph customization
 def plot_graphs(results, num_tests, graph_type):
-    test_cases = pd.DataFrame(results["Test Cases"])[:num_tests]
+    table = results["Test Cases"]
 
     st.subheader("Test Case Summary")
     st.json({
@@ -48,75 +42,76 @@ def plot_graphs(results, num_tests, graph_type):
         "Passed Tests": results["Passed Tests"]
     })
 
-    if graph_type == "Bar Graph":
-        fig = px.bar(test_cases, x="name", y="time", color="status", title="Test Execution Time by Test Case")
-    elif graph_type == "Pie Chart":
-        counts = test_cases["status"].value_counts()
-        fig = px.pie(names=counts.index, values=counts.values, title="Test Case Summary")
-    elif graph_type == "Line Graph":
-        fig = px.line(test_cases, x="name", y="time", color="status", title="Execution Time Trends")
-    
-    st.plotly_chart(fig)
-
-# Push to Ollama
-def push_to_ollama(data):
-    try:
-        payload = {
-            "model": "llama3",
-            "prompt": f"Index the following selected test data for semantic search:\n{data}",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            st.success("Selected test data pushed to Ollama successfully!")
-        else:
-            st.error(f"Failed to push data to Ollama: {response.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Request error: {e}")
-
-# Query Ollama
-def query_ollama(question):
-    try:
-        payload = {
-            "model": "llama3",
-            "prompt": f"Based on the indexed test results, answer this question: {question}",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            return response.json().get("response", "No response received.")
-        else:
-            st.error(f"Failed to query Ollama: {response.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Request error: {e}")
+    # Charts are built from bounded aggregates, never one point per test case
+    with recorder.stage("chart build"):
+        if graph_type == "Bar Graph":
+            fig = px.bar(chart_data.top_slowest(table, num_tests), x="test", y="time", color="status", title="Slowest Test Cases by Execution Time")
+        elif graph_type == "Pie Chart":
+            counts = chart_data.status_counts(table)
+            fig = px.pie(counts, names="status", values="count", title="Test Case Summary")
+        elif graph_type == "Line Graph":
+            fig = px.line(chart_data.time_series(table), x="test_index", y="time", hover_data=["name", "status"], title="Execution Time Trends")
+        elif graph_type == "Class Rollup":
+            fig = px.bar(chart_data.classname_rollup(table), x="classname", y=["passed", "failed"], title="Test Cases per Classname")
+        elif graph_type == "Time Histogram":
+            fig = px.bar(chart_data.time_histogram(table), x="bin_start", y="count", color="status", title="Execution Time Distribution")
+
+    with recorder.stage("chart render"):
+        st.plotly_chart(fig)
 
 # Streamlit UI
 st.title("JSON parser")
 
-uploaded_file = st.file_uploader("Upload XML Test Results", type="xml")
-
-if uploaded_file is not None:
-    results = parse_test_results(uploaded_file)
-    
-    # Number of test cases selection
-    st.subheader("Select Number of Test Cases to Display:")
-    num_tests = st.slider("Number of test cases:", 0, 1000, 100)
-
-    # Graph customization
-    st.subheader("Choose Graph Type:")
-    graph_type = st.selectbox("Select graph type:", ["Bar Graph", "Pie Chart", "Line Graph"])
-
-    # Plot graphs based on selection
-    plot_graphs(results, num_tests, graph_type)
-
-    # Push selected data to Ollama
-    if st.button("Push Test Data to Ollama"):
-        selected_data = results["Test Cases"][:num_tests]
-        push_to_ollama(selected_data)
+uploaded_files = st.file_uploader("Upload XML Test Results", type=["xml", "zip"], accept_multiple_files=True)
+
+results = None
+diff = None
+if uploaded_files:
+    results = page.parse_test_results(uploaded_files)
+    if results is not None:
+        diff = page.track_previous_run(results)
+
+        # Number of slowest test cases to chart
+        st.subheader("Select Number of Test Cases to Display:")
+        num_tests = st.slider("Number of slowest test cases:", 5, 200, 50)
+
+        # Graph customization
+        st.subheader("Choose Graph Type:")
+        graph_type = st.selectbox("Select graph type:", ["Bar Graph", "Pie Chart", "Line Graph", "Class Rollup", "Time Histogram"])
+
+        # Plot graphs based on selection
+        plot_graphs(results, num_tests, graph_type)
+        with st.expander("Test Cases"):
+            page.show_test_cases(results)
+        page.show_run_history(results, uploaded_files)
+        page.show_failure_triage(results)
+        if diff is not None:
+            page.show_changes(diff)
+
+        # Push test data to Ollama
+        if st.button("Push Test Data to Ollama"):
+            page.push_to_ollama(results, diff)
+        pushed = page.finished_job("push_job", "Failed to push data to Ollama")
+        if pushed is not None:
+            st.session_state["index_path"] = pushed.result
+            st.success(f"Test data pushed to Ollama successfully! ({pushed.message})")
 
 st.subheader("Ask Ollama About Test Results:")
 question = st.text_input("Enter your question:")
 if st.button("Query Ollama"):
     if question:
-        answer = query_ollama(question)
-        st.text_area("Answer:", answer, height=200)
\ No newline at end of file
+        answer = page.query_ollama(question, results, diff)
+        if answer is not None:
+            # Any widget click reruns the script, which closes the stream and stops generation
+            st.button("Stop")
+            st.write_stream(answer)
+            st.caption(llm_client.format_stream_stats(answer.stats))
+            st.caption(local_answers.format_routes(answer.stats))
+            st.caption(response_cache.format_stats(llm_cache.stats()))
+
+# Performance panel: per-stage timings for this run of the page
+with st.expander("Performance"):
+    st.checkbox("Trace memory (slower)", key="trace_memory")
+    st.dataframe(recorder.rows())
+    st.write("Model load and eval time:")
+    st.dataframe(llm.timings.rows())
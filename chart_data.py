@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from results_table import OUTCOMES, SKIPPED
+
+# Chart-ready aggregates over a TestCaseTable. Every function returns a small
+# DataFrame whose size is bounded by its arguments rather than by the number
+# of test cases, so the Plotly payload stays the same size however large the
+# run is.
+
+
+# The n slowest test cases, slowest first
+def top_slowest(table, n=50):
+    n = min(n, len(table))
+    if not n:
+        return pd.DataFrame(columns=["test", "name", "classname", "time", "status"])
+    top = np.argpartition(table.times, len(table) - n)[-n:]
+    top = top[np.argsort(table.times[top])[::-1]]
+    classnames = [table.classnames[code] for code in table.classname_codes[top]]
+    return pd.DataFrame({
+        # Names repeat across classes, so bars are labelled classname.name
+        "test": [f"{classname}.{name}" for classname, name in zip(classnames, table.names[top])],
+        "name": table.names[top],
+        "classname": classnames,
+        "time": table.times[top],
+        "status": [OUTCOMES[outcome] for outcome in table.outcomes[top]],
+    })
+
+
+# Per-classname test count, failures and time, largest total time first.
+# Classnames past the top n are folded into one "(other)" row.
+def classname_rollup(table, top=30):
+    size = len(table.classnames)
+    codes = table.classname_codes
+    rollup = pd.DataFrame({
+        "classname": table.classnames,
+        "tests": np.bincount(codes, minlength=size),
+        "failed": np.bincount(codes[table.failed], minlength=size),
+        "skipped": np.bincount(codes[table.outcomes == SKIPPED], minlength=size),
+        "total_time": np.bincount(codes, weights=table.times, minlength=size),
+    })
+    rollup = rollup[rollup["tests"] > 0].sort_values("total_time", ascending=False)
+    if len(rollup) > top:
+        rest = rollup.iloc[top:]
+        other = pd.DataFrame({
+            "classname": [f"(other {len(rest)})"],
+            "tests": [rest["tests"].sum()],
+            "failed": [rest["failed"].sum()],
+            "skipped": [rest["skipped"].sum()],
+            "total_time": [rest["total_time"].sum()],
+        })
+        rollup = pd.concat([rollup.iloc[:top], other], ignore_index=True)
+    rollup["passed"] = rollup["tests"] - rollup["failed"] - rollup["skipped"]
+    rollup["mean_time"] = rollup["total_time"] / rollup["tests"]
+    return rollup.reset_index(drop=True)
+
+
+# Execution time histogram with one row per (bin, outcome)
+def time_histogram(table, bins=50):
+    if not len(table):
+        return pd.DataFrame(columns=["bin_start", "bin_end", "status", "count"])
+    edges = np.histogram_bin_edges(table.times, bins=bins)
+    frames = []
+    for outcome, status in enumerate(OUTCOMES):
+        counts, _ = np.histogram(table.times[table.outcomes == outcome], bins=edges)
+        frames.append(pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "status": status, "count": counts}))
+    return pd.concat(frames, ignore_index=True)
+
+
+# Largest-Triangle-Three-Buckets: indices of at most `threshold` points that
+# keep the visual shape of the series (peaks and dips survive)
+def lttb_indices(x, y, threshold):
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0] = 0
+    picked[-1] = length - 1
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third corner
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        areas = np.abs(
+            (x[previous] - avg_x) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        picked[i + 1] = previous
+    return picked
+
+
+# Execution time in run order, downsampled with LTTB to at most max_points
+def time_series(table, max_points=2000):
+    x = np.arange(len(table), dtype=np.float64)
+    picked = lttb_indices(x, table.times, max_points)
+    return pd.DataFrame({
+        "test_index": picked,
+        "name": table.names[picked],
+        "time": table.times[picked],
+        "status": [OUTCOMES[outcome] for outcome in table.outcomes[picked]],
+    })
+
+
+# Pass/fail/skip counts for pie charts
+def status_counts(table):
+    stats = table.stats()
+    return pd.DataFrame({"status": ["PASSED", "FAILED", "SKIPPED"], "count": [stats["passed"], stats["failed"], stats["skipped"]]})
@@ -0,0 +1,219 @@
+import json
+import os
+
+import numpy as np
+
+from content_cache import sweep_dir, touch
+from results_table import ERROR, FAILED, TestCaseTable, TestCaseTableBuilder
+
+STORE_DIR = os.environ.get("COLUMNAR_STORE_DIR", ".columnar_store")
+# Least recently loaded entries are removed past either limit
+STORE_MAX_ENTRIES = int(os.environ.get("COLUMNAR_STORE_MAX_ENTRIES", "256"))
+STORE_MAX_BYTES = int(os.environ.get("COLUMNAR_STORE_MAX_MB", "2048")) * 1024 * 1024
+
+# Normalised columnar copies of parsed uploads, keyed by content hash. Each
+# entry is an uncompressed Arrow IPC file, written once on first ingest and
+# memory-mapped on later loads, so numeric columns come back as views over
+# the page cache instead of being decoded from XML or XLSX again. Every write
+# sweeps the store back under STORE_MAX_ENTRIES and STORE_MAX_BYTES; a mapped
+# entry that is swept stays readable until it is closed.
+
+
+pa = None
+ipc = None
+
+
+# pyarrow is optional and slow to import, so it is loaded on first use. The
+# store only speeds up reloads; without pyarrow every upload is parsed.
+def _load_arrow():
+    global pa, ipc
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError:
+            return False
+        pa, ipc = pyarrow, pyarrow.ipc
+    return True
+
+
+def enabled(root=STORE_DIR):
+    return bool(root) and _load_arrow()
+
+
+def _path(key, root):
+    return os.path.join(root, f"{key}.arrow")
+
+
+def exists(key, root=STORE_DIR):
+    return enabled(root) and os.path.exists(_path(key, root))
+
+
+def _open(key, root):
+    if not exists(key, root):
+        return None
+    touch(_path(key, root))
+    try:
+        return ipc.open_file(pa.memory_map(_path(key, root))).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+# Writes record batches to a temporary file and moves it into place only when
+# every batch has gone in, so readers never see a half-written entry
+class _Writer:
+    def __init__(self, key, root, schema):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.path = _path(key, root)
+        self.tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self.schema = schema
+        self.sink = pa.OSFile(self.tmp_path, "wb")
+        self.writer = ipc.new_file(self.sink, schema)
+
+    def write(self, batch):
+        self.writer.write(batch)
+
+    def commit(self):
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.tmp_path, self.path)
+        sweep_dir(self.root, STORE_MAX_ENTRIES, STORE_MAX_BYTES, keep=self.path)
+
+    def abort(self):
+        self.sink.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# JUnit results: classname, suite and failure type as dictionary columns
+# (codes plus category list), the outcome as a uint8 code, and the totals in
+# the schema metadata. The failed flag is derived from the outcome on load.
+def write_test_results(key, results, root=STORE_DIR):
+    if not enabled(root):
+        return
+    table = results["Test Cases"]
+    columns = {
+        "name": pa.array(table.names, type=pa.string()),
+        "classname": _dictionary(table.classname_codes, table.classnames),
+        "suite": _dictionary(table.suite_codes, table.suites),
+        "time": pa.array(np.ascontiguousarray(table.times, dtype=np.float64)),
+        "outcome": pa.array(np.ascontiguousarray(table.outcomes, dtype=np.uint8)),
+        "type": _dictionary(table.type_codes, table.types),
+        "message": pa.array(table.messages, type=pa.string()),
+        "detail": pa.array(table.details, type=pa.string()),
+    }
+    totals = {name: value for name, value in results.items() if name != "Test Cases"}
+    batch = pa.record_batch(
+        list(columns.values()),
+        schema=pa.schema(
+            [(name, column.type) for name, column in columns.items()], metadata={"totals": json.dumps(totals)}
+        ),
+    )
+    writer = _Writer(key, root, batch.schema)
+    try:
+        writer.write(batch)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+
+
+def _dictionary(codes, categories):
+    return pa.DictionaryArray.from_arrays(
+        pa.array(np.ascontiguousarray(codes, dtype=np.int32)), pa.array(categories, type=pa.string())
+    )
+
+
+# Map a stored run back into the results dict. Codes, times and outcomes are
+# zero-copy views over the mapped file; the string columns are the ones that
+# have to become Python objects.
+def read_test_results(key, root=STORE_DIR):
+    stored = _open(key, root)
+    if stored is None:
+        return None
+    totals = json.loads(stored.schema.metadata[b"totals"])
+    if not stored.num_rows:
+        return {**totals, "Test Cases": TestCaseTableBuilder().build()}
+    stored = stored.combine_chunks()
+    classnames = stored.column("classname").chunk(0)
+    suites = stored.column("suite").chunk(0)
+    types = stored.column("type").chunk(0)
+    outcomes = stored.column("outcome").chunk(0).to_numpy(zero_copy_only=True)
+    return {
+        **totals,
+        "Test Cases": TestCaseTable(
+            np.asarray(stored.column("name").to_pylist(), dtype=object),
+            classnames.indices.to_numpy(zero_copy_only=True),
+            classnames.dictionary.to_pylist(),
+            stored.column("time").chunk(0).to_numpy(zero_copy_only=True),
+            (outcomes == FAILED) | (outcomes == ERROR),
+            outcomes,
+            suites.indices.to_numpy(zero_copy_only=True),
+            suites.dictionary.to_pylist(),
+            types.indices.to_numpy(zero_copy_only=True),
+            types.dictionary.to_pylist(),
+            np.asarray(stored.column("message").to_pylist(), dtype=object),
+            np.asarray(stored.column("detail").to_pylist(), dtype=object),
+        ),
+    }
+
+
+# Pass DataFrame chunks through while appending them to a stored sheet. The
+# schema is fixed by the first chunk; if a later chunk does not fit it (a
+# numeric column that turns into text, say) the entry is dropped and the
+# chunks keep flowing without being stored.
+def store_frames(key, frames, root=STORE_DIR):
+    if not enabled(root):
+        yield from frames
+        return
+    writer = None
+    try:
+        for frame in frames:
+            if writer is not False:
+                writer = _append_frame(writer, key, root, frame)
+            yield frame
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    if writer:
+        writer.commit()
+
+
+def _append_frame(writer, key, root, frame):
+    try:
+        if writer is None:
+            batch = pa.RecordBatch.from_pandas(frame, preserve_index=False)
+            writer = _Writer(key, root, batch.schema)
+        else:
+            batch = pa.RecordBatch.from_pandas(frame, schema=writer.schema, preserve_index=False)
+        writer.write(batch)
+        return writer
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if writer:
+            writer.abort()
+        return False
+
+
+# Read a stored sheet back as DataFrames of up to chunk_size rows. Rows
+# start..stop and the wanted columns are sliced off the mapped file, so a
+# page deep into the sheet costs no more than the first one.
+def read_frames(key, columns=None, chunk_size=10000, start=0, stop=None, root=STORE_DIR):
+    stored = _open(key, root)
+    if stored is None:
+        return None
+    if columns is not None:
+        stored = stored.select([column for column in stored.column_names if column in columns])
+    stop = stored.num_rows if stop is None else min(stop, stored.num_rows)
+    return _iter_frames(stored, start, stop, chunk_size)
+
+
+def _iter_frames(stored, start, stop, chunk_size):
+    import pandas as pd
+
+    for offset in range(start, stop, chunk_size):
+        length = min(chunk_size, stop - offset)
+        frame = stored.slice(offset, length).to_pandas()
+        frame.index = pd.RangeIndex(offset, offset + length)
+        yield frame
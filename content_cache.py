@@ -0,0 +1,129 @@
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+
+# Hash raw bytes, a path or an uploaded file object in chunks; file objects
+# are rewound to where they were so they can still be parsed afterwards
+def content_hash(source, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    else:
+        position = source.tell()
+        source.seek(0)
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+        source.seek(position)
+    return digest.hexdigest()
+
+
+# Small LRU keyed by content hash, optionally backed by a directory of pickles
+# so results survive a Streamlit server restart
+class ContentCache:
+    def __init__(self, max_entries=8, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        path = self._path(key)
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+
+# Mark an on-disk cache entry (a file or a directory) as just used, for sweep_dir
+def touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _entry_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names
+    )
+
+
+# Bound a directory of cache entries, like ContentCache bounds its memory:
+# the least recently used entries (oldest mtime, see touch) are removed until
+# at most max_entries remain and they add up to at most max_bytes. `keep`,
+# the entry just written, is never removed, and neither are the temporary
+# files of writes in progress. Returns the paths removed.
+def sweep_dir(root, max_entries, max_bytes, keep=None):
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if ".tmp" in name or path == keep:
+            continue
+        try:
+            entries.append((os.path.getmtime(path), _entry_size(path), path))
+        except OSError:
+            continue
+    count = len(entries) + (keep is not None)
+    size = sum(entry[1] for entry in entries) + (_entry_size(keep) if keep is not None else 0)
+    removed = []
+    for _, entry_size, path in sorted(entries):
+        if count <= max_entries and size <= max_bytes:
+            break
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            continue
+        count -= 1
+        size -= entry_size
+        removed.append(path)
+    return removed
@@ -0,0 +1,216 @@
+import itertools
+import math
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+import columnar_store
+from content_cache import ContentCache, content_hash
+
+CHUNK_ROWS = 10000
+SERIES_COLUMNS = ["S_No", "Expected_Status", "Actual_Status", "URL"]
+SUMMARY_VERSION = 1
+SUMMARY_CACHE = ContentCache(cache_dir=os.environ.get("EXCEL_SUMMARY_CACHE_DIR"))
+
+
+def is_failure(value):
+    return "fail" in str(value).lower()
+
+
+def _is_xls(source):
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    return str(name).lower().endswith(".xls")
+
+
+def _store_key(source):
+    return f"sheet-v{SUMMARY_VERSION}-{content_hash(source)}"
+
+
+# Stream the first sheet as DataFrames of up to chunk_size rows, keeping only
+# `columns` (all of them when None). start/stop select data rows (blank rows
+# skipped) and the frames keep their position in the sheet as their index.
+# Sheets already in the columnar store are sliced off the mapped file;
+# otherwise the workbook itself is streamed.
+def iter_sheet_chunks(source, columns=None, chunk_size=CHUNK_ROWS, start=0, stop=None):
+    frames = columnar_store.read_frames(_store_key(source), columns, chunk_size, start, stop)
+    if frames is None:
+        frames = _iter_workbook_chunks(source, columns, chunk_size, start, stop)
+    return frames
+
+
+# xlsx workbooks are opened read-only, so openpyxl parses rows lazily instead
+# of building the whole sheet in memory
+def _iter_workbook_chunks(source, columns, chunk_size, start, stop):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if _is_xls(source):
+        # openpyxl only reads xlsx; legacy .xls sheets are read whole and sliced
+        frame = pd.read_excel(source).iloc[start:stop]
+        if columns is not None:
+            frame = frame[[column for column in frame.columns if column in columns]]
+        for offset in range(0, len(frame), chunk_size):
+            yield frame.iloc[offset:offset + chunk_size]
+        return
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(header)]
+        keep = [i for i, column in enumerate(header) if columns is None or column in columns]
+        names = [header[i] for i in keep]
+
+        data = (row for row in rows if any(value is not None for value in row))
+        selected = itertools.islice(data, start, stop)
+        position = start
+        while True:
+            batch = [
+                tuple(row[i] if i < len(row) else None for i in keep)
+                for row in itertools.islice(selected, chunk_size)
+            ]
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=names, index=pd.RangeIndex(position, position + len(batch)))
+            position += len(batch)
+    finally:
+        workbook.close()
+
+
+# One page of the sheet for the preview table
+def read_sheet_page(source, page, page_size=100, columns=None):
+    start = page * page_size
+    chunks = iter_sheet_chunks(source, columns, chunk_size=page_size, start=start, stop=start + page_size)
+    return next(chunks, pd.DataFrame(columns=columns or []))
+
+
+# Everything the Excel apps need from a sheet, accumulated one chunk at a
+# time: Status counts, Expected/Actual mismatches, numeric column ranges,
+# the first max_failing failing rows, an evenly spread sample of at most
+# max_sample other rows, and the SERIES_COLUMNS used by the line chart.
+class SheetSummary:
+    def __init__(self, status_column="Status", max_failing=200, max_sample=2000):
+        self.status_column = status_column
+        self.max_failing = max_failing
+        self.max_sample = max_sample
+        self.rows = 0
+        self.columns = []
+        self.dtypes = {}
+        self.status_counts = Counter()
+        self.has_mismatch = False
+        self.mismatched = 0
+        self.failing_total = 0
+        self.numeric = {}
+        self._failing = []
+        self._failing_kept = 0
+        self._sample = []
+        self._sample_step = 1
+        self._rest_seen = 0
+        self._series = []
+
+    def update(self, chunk):
+        if not self.columns:
+            self.columns = list(chunk.columns)
+            self.dtypes = {column: str(dtype) for column, dtype in chunk.dtypes.items()}
+            self.has_mismatch = {"Expected_Status", "Actual_Status"} <= set(self.columns)
+        self.rows += len(chunk)
+
+        failing = pd.Series(False, index=chunk.index)
+        if self.status_column in chunk.columns:
+            status = chunk[self.status_column]
+            self.status_counts.update(status.dropna().tolist())
+            failing |= status.map(is_failure)
+        if self.has_mismatch:
+            mismatch = chunk["Expected_Status"] != chunk["Actual_Status"]
+            self.mismatched += int(mismatch.sum())
+            failing |= mismatch
+
+        for column, values in chunk.select_dtypes("number").items():
+            if values.notna().any():
+                low, high, total, count = self.numeric.get(column, (math.inf, -math.inf, 0.0, 0))
+                self.numeric[column] = (
+                    min(low, values.min()), max(high, values.max()),
+                    total + float(values.sum()), count + int(values.count()),
+                )
+
+        self.failing_total += int(failing.sum())
+        if self._failing_kept < self.max_failing:
+            kept = chunk[failing].head(self.max_failing - self._failing_kept)
+            self._failing.append(kept)
+            self._failing_kept += len(kept)
+
+        self._add_sample(chunk[~failing])
+
+        series = [column for column in SERIES_COLUMNS if column in chunk.columns]
+        if series:
+            self._series.append(chunk[series])
+
+    # Systematic sample of the non-failing rows: keep every step-th row, and
+    # double the step (dropping every other kept row) whenever the sample
+    # outgrows max_sample, so it stays spread over the whole sheet
+    def _add_sample(self, rest):
+        positions = np.arange(self._rest_seen, self._rest_seen + len(rest))
+        self._rest_seen += len(rest)
+        picked = positions % self._sample_step == 0
+        self._sample.append((positions[picked], rest[picked]))
+        while sum(len(kept) for kept, _ in self._sample) > self.max_sample:
+            self._sample_step *= 2
+            self._sample = [
+                (kept[kept % self._sample_step == 0], frame[kept % self._sample_step == 0])
+                for kept, frame in self._sample
+            ]
+
+    def _concat(self, frames, columns):
+        frames = [frame for frame in frames if len(frame)]
+        return pd.concat(frames) if frames else pd.DataFrame(columns=columns)
+
+    def failing_rows(self):
+        return self._concat(self._failing, self.columns)
+
+    def sample_rows(self):
+        return self._concat([frame for _, frame in self._sample], self.columns)
+
+    @property
+    def rest_total(self):
+        return self.rows - self.failing_total
+
+    def status_frame(self):
+        return pd.DataFrame(self.status_counts.most_common(), columns=[self.status_column, "Count"])
+
+    def series(self):
+        return self._concat(self._series, [column for column in SERIES_COLUMNS if column in self.columns])
+
+    # The line chart series thinned to about max_points evenly spaced rows;
+    # rows where Expected_Status and Actual_Status disagree are always kept
+    # while there are no more than max_points of them
+    def series_sample(self, max_points=2000):
+        series = self.series()
+        if len(series) <= max_points:
+            return series
+        keep = np.arange(len(series)) % math.ceil(len(series) / max_points) == 0
+        if self.has_mismatch and self.mismatched <= max_points:
+            keep |= (series["Expected_Status"] != series["Actual_Status"]).to_numpy()
+        return series[keep]
+
+
+# Summarise the first sheet of a workbook in one streaming pass. Summaries are
+# cached by content hash, so Streamlit reruns do not rescan the file, and the
+# first pass over a workbook also writes it to the columnar store so later
+# passes and preview pages read the mapped copy instead of the XLSX.
+def summarize_sheet(source, cache=SUMMARY_CACHE, chunk_size=CHUNK_ROWS, status_column="Status"):
+    store_key = _store_key(source)
+    key = f"{store_key}-{status_column}"
+    summary = cache.get(key)
+    if summary is None:
+        summary = SheetSummary(status_column)
+        chunks = columnar_store.read_frames(store_key, chunk_size=chunk_size)
+        if chunks is None:
+            chunks = columnar_store.store_frames(store_key, _iter_workbook_chunks(source, None, chunk_size, 0, None))
+        for chunk in chunks:
+            summary.update(chunk)
+        cache.put(key, summary)
+    return summary
@@ -1,24 +1,47 @@
 #get answers
 import streamlit as st
-import pandas as pd
-import ollama
 import altair as alt
+import excel_reader
+import llm_client
+import perf
+import prompt_context
+import response_cache
+from content_cache import content_hash
 
 st.title('Dynamic Excel Analysis with Ollama')
 
+llm_cache = response_cache.get_cache()
+recorder = perf.Recorder("excell", trace_memory=st.session_state.get("trace_memory", perf.TRACE_MEMORY))
+perf.serve_metrics()
+
+# Model profile for this request
+profiles = llm_client.answer_profiles()
+profile = st.sidebar.selectbox("Model profile", profiles, index=profiles.index("deep"))
+llm, model = llm_client.resolve(profile)
+model_name = llm_client.model_key(llm, model)
+# Load the model in the background before the first question needs it
+llm_client.warm_up([profile])
+
 
 uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx", "xls"])
 
 if uploaded_file:
 
-    df = pd.read_excel(uploaded_file)
+    # One streaming pass for the counts, failing rows and prompt sample
+    with recorder.stage("read sheet"):
+        summary = excel_reader.summarize_sheet(uploaded_file)
     st.write("### Uploaded Data Preview")
-    st.dataframe(df)
+    page_size = 100
+    pages = max(1, -(-summary.rows // page_size))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+    with recorder.stage("preview page"):
+        preview = excel_reader.read_sheet_page(uploaded_file, page - 1, page_size)
+    st.dataframe(preview)
+    st.caption(f"{summary.rows} rows")
 
     
-    if 'Status' in df.columns:
-        status_counts = df['Status'].value_counts().reset_index()
-        status_counts.columns = ['Status', 'Count']
+    if 'Status' in summary.columns:
+        status_counts = summary.status_frame()
 
         chart = alt.Chart(status_counts).mark_bar().encode(
             x='Status',
@@ -29,15 +52,32 @@ if uploaded_file:
         st.altair_chart(chart, use_container_width=True)
 
       
-        ollama_client = ollama.Client(host='http://localhost:11434')
+        budget = st.sidebar.number_input("Prompt token budget", min_value=200, value=prompt_context.TOKEN_BUDGET, step=100)
         query = st.text_input("Ask Ollama about the data:")
         if st.button("Get Answer") and query:
-            model = 'llama3:latest'
-            response = ollama_client.chat(
-                model=model,
-                messages=[{"role": "user", "content": query + "\nData:\n" + df.to_string()}]
-            )
+            # Schema, aggregates, failing rows and a sample, sized to the budget
+            with recorder.stage("prompt context"):
+                context, report = prompt_context.build_summary_context(summary, budget)
+            content = query + "\nData:\n" + context
+            # Same question about the same sheet and budget is answered from the cache
+            dataset = f"{content_hash(uploaded_file)}-{budget}"
+            answer = recorder.track_stream("answer", response_cache.cached_stream(
+                llm_cache, model_name, query, dataset,
+                lambda: llm.stream_chat(model, [{"role": "user", "content": content}])
+            ), model_name)
             st.write("### Ollama's Response")
-            st.text_area("Answer:", response['message']['content'], height=200)
+            # Any widget click reruns the script, which closes the stream and stops generation
+            st.button("Stop")
+            st.write_stream(answer)
+            st.caption(llm_client.format_stream_stats(answer.stats))
+            st.caption(prompt_context.format_report(report, prompt_context.count_tokens(content)))
+            st.caption(response_cache.format_stats(llm_cache.stats()))
     else:
         st.error("The uploaded file must have a 'Status' column with 'Passed' and 'Failed' values.")
+
+# Performance panel: per-stage timings for this run of the page
+with st.expander("Performance"):
+    st.checkbox("Trace memory (slower)", key="trace_memory")
+    st.dataframe(recorder.rows())
+    st.write("Model load and eval time:")
+    st.dataframe(llm.timings.rows())
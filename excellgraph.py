@@ -1,11 +1,30 @@
 import streamlit as st
-import pandas as pd
-import ollama
 import plotly.express as px
+import uuid
+import app_ui
+import excel_reader
+import job_queue
+import llm_client
+import perf
+import prompt_context
+import response_cache
+from content_cache import content_hash
 
 
-ollama_client = ollama.Client()
+llm_cache = response_cache.get_cache()
+jobs = job_queue.get_queue()
+# Sessions share the job workers, which take their jobs in turn
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+recorder = perf.Recorder("excellgraph", trace_memory=st.session_state.get("trace_memory", perf.TRACE_MEMORY))
+perf.serve_metrics()
 
+# Model profile for this request
+profiles = llm_client.answer_profiles()
+profile = st.sidebar.selectbox("Model profile", profiles, index=profiles.index("deep"))
+llm, model = llm_client.resolve(profile)
+model_name = llm_client.model_key(llm, model)
+# Load the model in the background before the first question needs it
+llm_client.warm_up([profile])
 
 st.title('Excel File Analyzer with Ollama')
 
@@ -14,48 +33,103 @@ uploaded_file = st.file_uploader("Upload an Excel file", type=['xlsx'])
 
 
 data_str = ""
+budget = st.sidebar.number_input("Prompt token budget", min_value=200, value=prompt_context.TOKEN_BUDGET, step=100)
 
 if uploaded_file:
   
-    df = pd.read_excel(uploaded_file)
+    # One streaming pass for the counts, chart series and prompt sample
+    with recorder.stage("read sheet"):
+        summary = excel_reader.summarize_sheet(uploaded_file)
     st.write("Uploaded Data:")
-    st.dataframe(df)
+    page_size = 100
+    pages = max(1, -(-summary.rows // page_size))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+    with recorder.stage("preview page"):
+        preview = excel_reader.read_sheet_page(uploaded_file, page - 1, page_size)
+    st.dataframe(preview)
+    st.caption(f"{summary.rows} rows")
 
    
-    if 'Status' in df.columns:
-        status_counts = df['Status'].value_counts().reset_index()
-        status_counts.columns = ['Status', 'Count']
-        bar_chart = px.bar(status_counts, x='Status', y='Count', title='Pass/Fail Distribution')
-        st.plotly_chart(bar_chart)
+    if 'Status' in summary.columns:
+        status_counts = summary.status_frame()
+        with recorder.stage("chart build"):
+            bar_chart = px.bar(status_counts, x='Status', y='Count', title='Pass/Fail Distribution')
+        with recorder.stage("chart render"):
+            st.plotly_chart(bar_chart)
     
    
-    if all(col in df.columns for col in ['S_No', 'Expected_Status', 'Actual_Status', 'URL']):
-        line_chart = px.line(df, x='S_No', y=['Expected_Status', 'Actual_Status'], hover_data=['URL'], title='Line Chart of Test Results')
-        st.plotly_chart(line_chart)
+    if all(col in summary.columns for col in excel_reader.SERIES_COLUMNS):
+        with recorder.stage("chart build"):
+            line_chart = px.line(summary.series_sample(), x='S_No', y=['Expected_Status', 'Actual_Status'], hover_data=['URL'], title='Line Chart of Test Results')
+        with recorder.stage("chart render"):
+            st.plotly_chart(line_chart)
 
    
-    ollama_data = df.to_dict(orient='records')
-    data_str = "\n".join([str(record) for record in ollama_data])
+    # Schema, aggregates, failing rows and a sample, sized to the budget
+    with recorder.stage("prompt context"):
+        data_str, report = prompt_context.build_summary_context(summary, budget)
 
    
-    ollama_client.chat(
-        model='llama3:latest',
-        messages=[{"role": "user", "content": "Here is the test data:\n" + data_str}]
-    )
-    st.success("Data has been sent to Ollama and is ready for querying!")
+    # Reruns with the same sheet and budget skip the model call entirely. The
+    # call runs as a background job so the page stays usable while it is sent.
+    dataset = f"{content_hash(uploaded_file)}-{budget}"
+    prompt = "Here is the test data:\n" + data_str
+
+    def send(job):
+        with app_ui.job_recorder(recorder, job).stage("send data"):
+            return response_cache.cached_call(
+                llm_cache, model_name, "Here is the test data", dataset,
+                lambda: llm.chat(model, [{"role": "user", "content": prompt}])['message']['content']
+            )
+
+    # Sent once per sheet and budget. A failed send stays failed until Retry is
+    # clicked, so an unreachable Ollama is not called again on every rerun.
+    send_key = f"send:{model_name}:{dataset}"
+
+    def submit_send(retry=False):
+        st.session_state['send_key'] = send_key
+        st.session_state['send_job'] = jobs.submit(
+            send_key, send, owner=session_id, label="Sending data to Ollama", retry=retry
+        ).id
+
+    if st.session_state.get('send_key') != send_key or jobs.get(st.session_state.get('send_job')) is None:
+        submit_send()
+    if app_ui.finished_job(jobs, 'send_job', "Failed to send data to Ollama", recorder) is not None:
+        st.success("Data has been sent to Ollama and is ready for querying!")
+    elif jobs.get(st.session_state['send_job']).status in ("failed", "cancelled") and st.button("Retry sending data"):
+        submit_send(retry=True)
+        st.rerun()
 
    
     st.session_state['data_str'] = data_str
+    st.session_state['context_report'] = report
+    st.session_state['dataset'] = dataset
 
 
 query = st.text_input("Ask something about your data:")
 if query and 'data_str' in st.session_state:
-    response = ollama_client.chat(
-        model='llama3:latest',
-        messages=[
-            {"role": "user", "content": "Here is the test data:\n" + st.session_state['data_str']},
-            {"role": "user", "content": query}
-        ]
-    )
+    answer = recorder.track_stream("answer", response_cache.cached_stream(
+        llm_cache, model_name, query, st.session_state['dataset'],
+        lambda: llm.stream_chat(
+            model,
+            [
+                {"role": "user", "content": "Here is the test data:\n" + st.session_state['data_str']},
+                {"role": "user", "content": query}
+            ]
+        )
+    ), model_name)
     st.write("Ollama's Response:")
-    st.text(response['message']['content'])
+    # Any widget click reruns the script, which closes the stream and stops generation
+    st.button("Stop")
+    st.write_stream(answer)
+    st.caption(llm_client.format_stream_stats(answer.stats))
+    sent = prompt_context.count_tokens(st.session_state['data_str']) + prompt_context.count_tokens(query)
+    st.caption(prompt_context.format_report(st.session_state['context_report'], sent))
+    st.caption(response_cache.format_stats(llm_cache.stats()))
+
+# Performance panel: per-stage timings for this run of the page
+with st.expander("Performance"):
+    st.checkbox("Trace memory (slower)", key="trace_memory")
+    st.dataframe(recorder.rows())
+    st.write("Model load and eval time:")
+    st.dataframe(llm.timings.rows())
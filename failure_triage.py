@@ -0,0 +1,237 @@
+import asyncio
+import re
+import zlib
+
+import numpy as np
+
+# Failure triage: group failed test cases by root cause so the model is asked
+# once per distinct cause rather than once per failure. Messages and traces
+# are normalised (numbers, addresses, ids and paths stripped), identical
+# signatures are grouped by hash, and near-identical ones are merged with
+# MinHash and LSH banding. The work grows with the number of distinct
+# signatures, not with the number of failures.
+
+# Trace lines kept in a signature; causes differ at the top of the stack
+MAX_FRAMES = 5
+
+# 64 MinHash values split into 16 bands of 4: signature pairs above roughly
+# 0.5 Jaccard similarity become candidates, and are merged at THRESHOLD
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.7
+SHINGLE = 2
+
+TRIAGE_PROMPT = (
+    "{size} failing tests share this failure. In two or three sentences, explain the most likely root cause "
+    "and where to look first.\n\nExample test: {test}\nType: {type}\nMessage: {message}\nTrace:\n{detail}"
+)
+
+_NORMALIZE = [
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-f]+\b", re.IGNORECASE), "<addr>"),
+    # Anchored on the separator; a Windows drive letter stays in front as "C:<path>"
+    (re.compile(r"[\\/][\w.@~-]+(?:[\\/][\w.@~-]+)+[\\/]?"), "<path>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+    (re.compile(r"[^\S\n]+"), " "),
+]
+
+_rng = np.random.default_rng(0)
+_PERM_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+
+# Line breaks are kept so a trace can still be split into frames
+def normalize(text):
+    for pattern, replacement in _NORMALIZE:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+# What makes two failures the same cause: the failure type, the normalised
+# message and the top of the normalised trace
+def signature(failure_type, message, detail):
+    message = normalize(message)
+    head = normalize("\n".join(detail.split("\n", MAX_FRAMES + 1)[:MAX_FRAMES + 1]))
+    frames = [line.strip() for line in head.split("\n")]
+    frames = [line for line in frames if line and line != message][:MAX_FRAMES]
+    return "\n".join([failure_type, message, *frames])
+
+
+# MinHash of a signature's word shingles, with multiply-shift hashing over
+# crc32 token hashes so the values are the same in every process
+def minhash(text):
+    words = text.split()
+    shingles = {" ".join(words[i:i + SHINGLE]) for i in range(max(1, len(words) - SHINGLE + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    return ((hashes[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)).min(axis=0)
+
+
+# Cluster the failed rows of a TestCaseTable. Returns the clusters, largest
+# first, and an int32 array giving each row's cluster (-1 for rows that did
+# not fail). Each cluster carries its representative failure (the first row
+# of its largest exact group), so it can be explained without the table.
+def cluster_failures(table, threshold=THRESHOLD):
+    cluster_of = np.full(len(table), -1, dtype=np.int32)
+    failed = np.flatnonzero(table.failed)
+    if not len(failed):
+        return [], cluster_of
+
+    # Exact grouping first: MinHash only ever sees distinct signatures
+    groups = {}
+    for row in failed.tolist():
+        text = signature(table.types[table.type_codes[row]], table.messages[row], table.details[row])
+        groups.setdefault(text, []).append(row)
+    texts = list(groups)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(texts) > 1:
+        hashes = np.stack([minhash(text) for text in texts])
+        rows_per_band = NUM_PERM // BANDS
+        for band in range(BANDS):
+            buckets = {}
+            for i, key in enumerate(map(bytes, hashes[:, band * rows_per_band:(band + 1) * rows_per_band])):
+                first = buckets.setdefault(key, i)
+                if first != i and np.mean(hashes[first] == hashes[i]) >= threshold:
+                    parent[find(i)] = find(first)
+
+    merged = {}
+    for i, text in enumerate(texts):
+        merged.setdefault(find(i), []).append(text)
+
+    clusters = []
+    for members in merged.values():
+        members.sort(key=lambda text: len(groups[text]), reverse=True)
+        rows = np.sort(np.concatenate([np.asarray(groups[text], dtype=np.int64) for text in members]))
+        representative = groups[members[0]][0]
+        clusters.append({
+            "signature": members[0],
+            "size": len(rows),
+            "variants": len(members),
+            "test": f"{table.classnames[table.classname_codes[representative]]}.{table.names[representative]}",
+            "type": table.types[table.type_codes[representative]],
+            "message": table.messages[representative],
+            "detail": table.details[representative],
+            "members": rows,
+        })
+    clusters.sort(key=lambda cluster: cluster["size"], reverse=True)
+    for i, cluster in enumerate(clusters):
+        cluster["cluster"] = i
+        cluster_of[cluster["members"]] = i
+    return clusters, cluster_of
+
+
+def triage_prompt(cluster):
+    return TRIAGE_PROMPT.format(
+        size=cluster["size"], test=cluster["test"], type=cluster["type"] or "unknown",
+        message=cluster["message"], detail=cluster["detail"],
+    )
+
+
+# Ask the model to explain each cluster, one request per distinct signature,
+# sent concurrently on the client's worker pool. Explanations are cached by
+# provider, model and signature, so a cause seen in an earlier build costs nothing.
+# Sets "explanation" (or "explanation_error") on every cluster passed in,
+# including clusters from different runs that share a signature.
+# progress(done, total) is called as each answer comes back; an exception it
+# raises stops the remaining requests.
+def explain_clusters(client, model, clusters, cache=None, limit=None, progress=None):
+    # Imported here so clustering alone (batch --diff, benchmarks) needs no HTTP client
+    import llm_client
+
+    cache_model = llm_client.model_key(client, model)
+    by_signature = {}
+    for cluster in clusters[:limit]:
+        by_signature.setdefault(cluster["signature"], []).append(cluster)
+
+    pending = []
+    for text, same in by_signature.items():
+        cached = cache.get(cache.key(cache_model, text, "failure-triage")) if cache is not None else None
+        if cached is None:
+            pending.append(text)
+        else:
+            for cluster in same:
+                cluster["explanation"] = cached
+
+    if pending:
+        prompts = [triage_prompt(by_signature[text][0]) for text in pending]
+        done = 0
+
+        # A failed request is kept as its exception, in prompt order
+        async def explain(prompt):
+            nonlocal done
+            try:
+                response = await client.agenerate(model, prompt)
+            except Exception as e:
+                response = e
+            done += 1
+            if progress is not None:
+                progress(done, len(prompts))
+            return response
+
+        async def run():
+            return await asyncio.gather(*(explain(prompt) for prompt in prompts))
+
+        responses = asyncio.run(run())
+        for text, response in zip(pending, responses):
+            if isinstance(response, Exception):
+                for cluster in by_signature[text]:
+                    cluster["explanation_error"] = f"{type(response).__name__}: {response}"
+                continue
+            explanation = response.get("response", "").strip()
+            if cache is not None and explanation:
+                cache.put(cache.key(cache_model, text, "failure-triage"), cache_model, explanation)
+            for cluster in by_signature[text]:
+                cluster["explanation"] = explanation
+    return len(pending)
+
+
+# Explanations by signature, so they can be carried over to other cluster
+# lists with the same causes (another session's, or a later run's)
+def explanations(clusters):
+    return {
+        cluster["signature"]: {field: cluster[field] for field in ("explanation", "explanation_error") if field in cluster}
+        for cluster in clusters
+    }
+
+
+def apply_explanations(clusters, explained):
+    for cluster in clusters:
+        cluster.update(explained.get(cluster["signature"], {}))
+
+
+# One row per cluster for a table or a JSON record
+def cluster_rows(clusters):
+    return [
+        {
+            "cluster": cluster["cluster"],
+            "failures": cluster["size"],
+            "variants": cluster["variants"],
+            "type": cluster["type"],
+            "message": cluster["message"],
+            "example": cluster["test"],
+            "explanation": cluster.get("explanation") or cluster.get("explanation_error", ""),
+        }
+        for cluster in clusters
+    ]
+
+
+# One row per failed test with its cluster's explanation attached
+def member_rows(table, clusters):
+    rows = []
+    for cluster in clusters:
+        explanation = cluster.get("explanation", "")
+        for row in cluster["members"].tolist():
+            rows.append({
+                "test": f"{table.classnames[table.classname_codes[row]]}.{table.names[row]}",
+                "cluster": cluster["cluster"],
+                "message": table.messages[row],
+                "explanation": explanation,
+            })
+    return rows
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+# Finished jobs kept for sessions to pick up, oldest dropped first
+KEEP_FINISHED = 256
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# One unit of background work. fn(job) runs on a worker thread and may call
+# job.report() to publish progress; its return value becomes job.result and
+# anything it raises becomes job.error. status moves from "queued" through
+# "running" to "done", "failed" or "cancelled". fn may leave stage timings in
+# job.records for whoever picks the finished job up.
+class Job:
+    def __init__(self, job_id, label, owner, fn):
+        self.id = job_id
+        self.label = label
+        self.owner = owner
+        self.fn = fn
+        self.status = "queued"
+        self.done = 0
+        self.total = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.records = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    # Progress as done of total units; raises JobCancelled once the job has
+    # been cancelled, so long jobs stop at their next report
+    def report(self, done, total=None, message=None):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+    def fraction(self):
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    # One line for a progress bar or status caption
+    def describe(self):
+        if self.status == "queued":
+            return f"{self.label}: waiting for a worker"
+        if self.status == "running" and self.total:
+            return f"{self.label}: {self.message or f'{self.done} of {self.total}'}"
+        return f"{self.label}: {self.message or self.status}"
+
+
+# Background jobs on a small pool of worker threads, shared by every session
+# of the server. A job is identified by a key describing its work: submitting
+# a key that is already known returns the existing job, so reruns and other
+# sessions asking for the same thing never start it twice, and its result
+# stays available after the script run that asked for it. A failed or
+# cancelled job is only replaced when the caller asks to retry it, so a page
+# that submits on every rerun does not resubmit a failing job forever. Queued jobs
+# are taken round-robin across owners (sessions), so one session queuing
+# many jobs does not hold up everyone else.
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, keep=KEEP_FINISHED):
+        self.workers = workers
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._pending = OrderedDict()
+        self._ready = threading.Condition()
+        self._threads = []
+
+    def submit(self, key, fn, owner=None, label="Job", retry=False):
+        job_id = hashlib.sha256(key.encode()).hexdigest()[:16]
+        with self._ready:
+            job = self._jobs.get(job_id)
+            if job is not None and (job.status in ("queued", "running", "done") or not retry):
+                return job
+            job = self._jobs[job_id] = Job(job_id, label, owner, fn)
+            self._jobs.move_to_end(job_id)
+            self._pending.setdefault(owner, deque()).append(job)
+            self._start_workers()
+            self._ready.notify()
+        return job
+
+    def get(self, job_id):
+        with self._ready:
+            return self._jobs.get(job_id)
+
+    # A queued job is dropped straight away; a running one stops at its next report()
+    def cancel(self, job_id):
+        with self._ready:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished():
+                return
+            job._cancel.set()
+            queue = self._pending.get(job.owner)
+            if job.status == "queued" and queue is not None:
+                queue.remove(job)
+                if not queue:
+                    del self._pending[job.owner]
+                self._finish(job, "cancelled")
+
+    def stats(self):
+        with self._ready:
+            counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            counts["owners_waiting"] = len(self._pending)
+            return counts
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    # Next job round-robin: the first owner in line gives up one job and, if
+    # it has more, goes to the back of the line
+    def _next(self):
+        owner, queue = next(iter(self._pending.items()))
+        job = queue.popleft()
+        del self._pending[owner]
+        if queue:
+            self._pending[owner] = queue
+        return job
+
+    def _work(self):
+        while True:
+            with self._ready:
+                while not self._pending:
+                    self._ready.wait()
+                job = self._next()
+                job.status = "running"
+                job.started = time.time()
+            try:
+                result = job.fn(job)
+            except JobCancelled:
+                with self._ready:
+                    self._finish(job, "cancelled")
+            except Exception as e:
+                with self._ready:
+                    job.error = e
+                    self._finish(job, "failed")
+            else:
+                with self._ready:
+                    job.result = result
+                    self._finish(job, "done")
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.fn = None
+        finished = [job_id for job_id, other in self._jobs.items() if other.finished()]
+        for job_id in finished[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job_id]
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_queue():
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
@@ -0,0 +1,307 @@
+import io
+import os
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import columnar_store
+from content_cache import ContentCache, content_hash
+from results_table import ERROR, FAILED, OUTCOMES, PASSED, SKIPPED, TestCaseTableBuilder, concat_tables
+
+# Bump when the shape of parsed results changes so stale disk entries are ignored
+PARSER_VERSION = 4
+
+PARSE_CACHE = ContentCache(cache_dir=os.environ.get("JUNIT_PARSE_CACHE_DIR"))
+
+# Counts in the results dict. "Failed Tests" includes errors, so it matches
+# the failed flag every chart and prompt uses; "Passed Tests" excludes
+# skipped cases.
+COUNTS = ("Total Tests", "Failed Tests", "Passed Tests", "Error Tests", "Skipped Tests")
+
+# Totals a report can declare on its <testsuites>/<testsuite> elements
+DECLARED = ("tests", "failures", "errors", "skipped")
+
+# Child elements of a <testcase> that decide its outcome. rerunFailure and
+# flakyFailure (Surefire reruns of a test that then passed) are ignored.
+OUTCOME_TAGS = {"failure": FAILED, "error": ERROR, "skipped": SKIPPED}
+
+
+# Parse a JUnit XML file into the results dict shared by all the apps.
+# Results are cached by content hash, so a Streamlit rerun with the same
+# upload returns the already-built result without touching the XML.
+# store=False leaves the columnar store (and pyarrow) out of it.
+def parse_test_results(xml_file, cache=PARSE_CACHE, store=True):
+    key = f"junit-v{PARSER_VERSION}-{content_hash(xml_file)}"
+    results = _load(key, cache, store)
+    if results is None:
+        results = _build_results(xml_file)
+        _save(key, results, cache, store)
+    return results
+
+
+# In-memory cache first, then the memory-mapped columnar store, which also
+# survives server restarts
+def _load(key, cache, store=True):
+    results = cache.get(key)
+    if results is None and store:
+        results = columnar_store.read_test_results(key)
+        if results is not None:
+            cache.put(key, results)
+    return results
+
+
+def _save(key, results, cache, store=True):
+    cache.put(key, results)
+    if store:
+        columnar_store.write_test_results(key, results)
+
+
+# Parse a sharded run: any mix of XML uploads, zip archives, paths and
+# directories. Files missing from the cache are parsed concurrently in a
+# process pool; each worker sends back a columnar table, and the tables are
+# merged into a single results dict. store=False skips the columnar store,
+# for one-off runs that gain nothing from it.
+def parse_test_runs(sources, cache=PARSE_CACHE, max_workers=None, store=True):
+    payloads = {}
+    keys = []
+    for payload in _expand_sources(sources):
+        key = f"junit-v{PARSER_VERSION}-{content_hash(payload)}"
+        payloads.setdefault(key, payload)
+        keys.append(key)
+
+    if len(keys) == 1:
+        run_key = keys[0]
+    else:
+        run_key = f"junit-run-v{PARSER_VERSION}-{content_hash(chr(0).join(keys).encode())}"
+    merged = _load(run_key, cache, store)
+    if merged is not None:
+        return merged
+
+    parsed = {}
+    pending = {}
+    for key, payload in payloads.items():
+        results = _load(key, cache, store)
+        if results is None:
+            pending[key] = payload
+        else:
+            parsed[key] = results
+
+    if len(pending) == 1 or max_workers == 1:
+        parsed.update((key, _parse_payload(payload)) for key, payload in pending.items())
+    elif pending:
+        workers = min(len(pending), max_workers or os.cpu_count() or 1)
+        chunksize = max(1, len(pending) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed.update(zip(pending, pool.map(_parse_payload, pending.values(), chunksize=chunksize)))
+    for key in pending:
+        _save(key, parsed[key], cache, store)
+
+    parts = [parsed[key] for key in keys]
+    merged = {name: sum(part[name] for part in parts) for name in COUNTS}
+    # A declared total only adds up if every file declares it
+    merged["Declared Totals"] = {
+        name: sum(part["Declared Totals"][name] for part in parts)
+        for name in DECLARED
+        if all(name in part["Declared Totals"] for part in parts)
+    }
+    merged["Test Cases"] = concat_tables([part["Test Cases"] for part in parts])
+    if run_key not in payloads:
+        _save(run_key, merged, cache, store)
+    return merged
+
+
+# Paths are handed to workers as-is; uploads and zip members as bytes
+def _expand_sources(sources):
+    if isinstance(sources, (str, os.PathLike)) or hasattr(sources, "read"):
+        sources = [sources]
+    for source in sources:
+        if isinstance(source, (str, os.PathLike)):
+            if os.path.isdir(source):
+                for folder, _, files in os.walk(source):
+                    paths = [os.path.join(folder, name) for name in sorted(files)]
+                    yield from _expand_sources(p for p in paths if p.endswith((".xml", ".zip")))
+            elif str(source).endswith(".zip"):
+                yield from _zip_members(source)
+            else:
+                yield os.fspath(source)
+        elif getattr(source, "name", "").endswith(".zip"):
+            yield from _zip_members(source)
+        else:
+            yield source.getvalue() if hasattr(source, "getvalue") else source.read()
+
+
+def _zip_members(archive):
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if not info.is_dir() and info.filename.endswith(".xml"):
+                yield zf.read(info)
+
+
+def _parse_payload(payload):
+    if isinstance(payload, bytes):
+        payload = io.BytesIO(payload)
+    return _build_results(payload)
+
+
+def _build_results(xml_file):
+    declared, rows = _open_rows(xml_file)
+    builder = TestCaseTableBuilder()
+    builder.extend(rows)
+    table = builder.build()
+    stats = table.stats()
+    return {
+        "Total Tests": stats["total"],
+        "Failed Tests": stats["failed"],
+        "Passed Tests": stats["passed"],
+        "Error Tests": stats["errors"],
+        "Skipped Tests": stats["skipped"],
+        "Declared Totals": declared,
+        "Test Cases": table,
+    }
+
+
+# Differences between the totals a report declares and what it contains,
+# one line each, for a warning in the apps. The counted values are the ones
+# used everywhere else.
+def reconcile_totals(results):
+    counted = {
+        "tests": results["Total Tests"],
+        "failures": results["Failed Tests"] - results["Error Tests"],
+        "errors": results["Error Tests"],
+        "skipped": results["Skipped Tests"],
+    }
+    return [
+        f"The report declares {declared} {name} but contains {counted[name]}."
+        for name, declared in results["Declared Totals"].items()
+        if declared != counted[name]
+    ]
+
+
+# Stream test cases from a JUnit XML file without building the whole tree.
+# Returns the declared totals and a generator of test case records; every
+# element is cleared and detached as soon as it has been read, so peak
+# memory stays flat however large the file is. When the root declares no
+# totals they are summed from its child suites as those are reached, so the
+# dict is only complete once the generator is exhausted.
+def stream_test_results(xml_file):
+    declared, rows = _open_rows(xml_file)
+    return declared, _iter_records(rows)
+
+
+def _iter_records(rows):
+    for name, classname, time, outcome, suite, failure_type, message, _ in rows:
+        record = {"name": name, "classname": classname, "suite": suite, "time": time, "status": OUTCOMES[outcome]}
+        if message:
+            record["message"] = message
+            record["type"] = failure_type
+        yield record
+
+
+def _open_rows(xml_file):
+    target = _ReportTarget()
+    parser = ET.XMLParser(target=target)
+    chunks = _read_chunks(xml_file)
+    # Feed until the root element is open, so its declared totals are known
+    for chunk in chunks:
+        parser.feed(chunk)
+        if target.root is not None:
+            break
+    return target.declared, _iter_rows(parser, target, chunks)
+
+
+def _read_chunks(xml_file, size=64 * 1024):
+    if isinstance(xml_file, (str, os.PathLike)):
+        with open(xml_file, "rb") as f:
+            yield from iter(lambda: f.read(size), b"")
+    else:
+        yield from iter(lambda: xml_file.read(size), b"")
+
+
+# Rows are handed on after every chunk, so at most one chunk's worth is held
+def _iter_rows(parser, target, chunks):
+    yield from target.drain()
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from target.drain()
+    parser.close()
+    yield from target.drain()
+
+
+def _declared_totals(attrib, into):
+    for name in DECLARED:
+        value = attrib.get(name)
+        if value:
+            into[name] = into.get(name, 0) + int(value)
+
+
+# Parser target fed straight from expat: no elements are built, so there is
+# nothing to search below a test case and nothing to clear afterwards. Test
+# cases are taken at any depth and attributed to their innermost enclosing
+# suite; their outcome comes from a <failure>/<error>/<skipped> child as it
+# closes. Rows are TestCaseTableBuilder.append arguments:
+# (name, classname, time, outcome, suite, failure_type, message, detail).
+class _ReportTarget:
+    def __init__(self):
+        self.root = None
+        self.declared = {}
+        self.rows = []
+        self._depth = 0
+        self._sum_suites = False
+        self._suites = [""]
+        self._case = None
+        self._case_depth = 0
+        self._result = None
+        self._text = None
+
+    def start(self, tag, attrib):
+        self._depth += 1
+        if tag == "testcase":
+            value = attrib.get("time")
+            try:
+                time = float(value) if value else 0.0
+            except ValueError:
+                # Surefire writes times over a second with a thousands separator
+                time = float(value.replace(",", ""))
+            self._case = [attrib.get("name", "N/A"), attrib.get("classname", "N/A"), time, PASSED, self._suites[-1], "", "", ""]
+            self._case_depth = self._depth
+        elif tag == "testsuite":
+            self._suites.append(attrib.get("name", ""))
+            if self._sum_suites and self._depth == 2:
+                _declared_totals(attrib, self.declared)
+        elif self._case is not None and self._depth == self._case_depth + 1 and tag in OUTCOME_TAGS:
+            outcome = OUTCOME_TAGS[tag]
+            current = self._case[3]
+            # The first failure or error decides; either one overrides a skip
+            if current == PASSED or (current == SKIPPED and outcome != SKIPPED):
+                self._result = (outcome, attrib.get("type", ""), attrib.get("message"))
+                self._text = []
+        if self.root is None:
+            self.root = tag
+            _declared_totals(attrib, self.declared)
+            self._sum_suites = not self.declared
+
+    def end(self, tag):
+        depth = self._depth
+        self._depth -= 1
+        if tag == "testcase":
+            if self._case is not None:
+                self.rows.append(tuple(self._case))
+                self._case = None
+        elif tag == "testsuite":
+            self._suites.pop()
+        elif self._result is not None and depth == self._case_depth + 1:
+            outcome, failure_type, message = self._result
+            detail = "".join(self._text).strip()
+            self._case[3:] = [outcome, self._case[4], failure_type, message or detail.partition("\n")[0], detail]
+            self._result = self._text = None
+
+    def data(self, text):
+        if self._text is not None:
+            self._text.append(text)
+
+    def close(self):
+        pass
+
+    def drain(self):
+        rows, self.rows = self.rows, []
+        return rows
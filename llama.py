@@ -1,90 +1,41 @@
 import streamlit as st
-import xml.etree.ElementTree as ET
-import requests
+import uuid
 import plotly.express as px
-import pandas as pd
-
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-
-# Parse test results from XML
-def parse_test_results(xml_file):
-    try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        total_tests = int(root.get("tests", 0))
-        total_failures = int(root.get("failures", 0))
-
-        test_data = []
-        for testcase in root.findall("testcase")[:1000]:
-            name = testcase.get("name", "N/A")
-            classname = testcase.get("classname", "N/A")
-            time = float(testcase.get("time", 0))
-            failure = testcase.find("failure")
-            status = "FAILED" if failure is not None else "PASSED"
-            test_data.append({"name": name, "classname": classname, "time": time, "status": status})
-
-        results = {
-            "Total Tests": total_tests,
-            "Failed Tests": total_failures,
-            "Passed Tests": total_tests - total_failures,
-            "Test Cases": test_data
-        }
-
-        return results
-
-    except ET.ParseError as e:
-        st.error(f"Error parsing XML: {e}")
-    except Exception as e:
-        st.error(f"Unexpected error: {e}")
-
-# Generate graph summaries
-def generate_graph_summaries(results):
-    test_cases = pd.DataFrame(results["Test Cases"])
-    pass_count = len(test_cases[test_cases["status"] == "PASSED"])
-    fail_count = len(test_cases[test_cases["status"] == "FAILED"])
-    avg_time = test_cases["time"].mean()
-    max_time = test_cases["time"].max()
-    min_time = test_cases["time"].min()
-
-    summary = f"Test Summary:\nTotal Tests: {results['Total Tests']}\nPassed: {pass_count}\nFailed: {fail_count}\nAverage Execution Time: {avg_time:.2f}s\nMax Execution Time: {max_time:.2f}s\nMin Execution Time: {min_time:.2f}s\n"
-    
-    return summary
-
-# Push data and graph summaries to Ollama
-def push_to_ollama(data, graph_summary):
-    try:
-        payload = {
-            "model": "llama3",
-            "prompt": f"Index the following test results for semantic search:\n{data}\nGraph Summary:\n{graph_summary}",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            st.success("Data and graph summaries pushed to Ollama successfully!")
-        else:
-            st.error(f"Failed to push data to Ollama: {response.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Request error: {e}")
-
-# Query Ollama
-def query_ollama(question):
-    try:
-        payload = {
-            "model": "llama3",
-            "prompt": f"Based on the indexed test results and graph insights, answer this question: {question}",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            return response.json().get("response", "No response received.")
-        else:
-            st.error(f"Failed to query Ollama: {response.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Request error: {e}")
+import app_ui
+import chart_data
+import job_queue
+import llm_client
+import local_answers
+import perf
+import response_cache
+import run_history
+import summaries
+
+llm_cache = response_cache.get_cache()
+jobs = job_queue.get_queue()
+# Sessions share the job workers, which take their jobs in turn
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+history = run_history.get_history()
+recorder = perf.Recorder("llama", trace_memory=st.session_state.get("trace_memory", perf.TRACE_MEMORY))
+perf.serve_metrics()
+
+# Model profile for this request; the embedding model indexes and retrieves
+profiles = llm_client.answer_profiles()
+profile = st.sidebar.selectbox("Model profile", profiles, index=profiles.index("deep"))
+llm, model = llm_client.resolve(profile)
+embedder, embed_model = llm_client.resolve("embed")
+# Load both models in the background before the first request needs them
+llm_client.warm_up([profile, "embed"])
+# Parsing, the test case table and the Ollama calls, shared with the other
+# result pages
+page = app_ui.ResultsPage(
+    recorder, llm, model, embedder, embed_model, jobs, session_id, llm_cache,
+    history=history, subject="test results and graph insights",
+)
 
 # Visualization
 def plot_graphs(results):
-    test_cases = pd.DataFrame(results["Test Cases"])
+    table = results["Test Cases"]
 
     st.subheader("Test Case Summary")
     st.json({
@@ -93,27 +44,69 @@ def plot_graphs(results):
         "Passed Tests": results["Passed Tests"]
     })
 
-    fig = px.bar(test_cases, x="name", y="time", color="status", title="Test Execution Time by Test Case")
-    st.plotly_chart(fig)
+    # Bounded aggregates instead of one bar per test case
+    with recorder.stage("chart build"):
+        fig = px.bar(chart_data.top_slowest(table, 50), x="test", y="time", color="status", title="Slowest Test Cases by Execution Time")
+    with recorder.stage("chart render"):
+        st.plotly_chart(fig)
 
-    fig = px.pie(names=["Passed", "Failed"], values=[results["Passed Tests"], results["Failed Tests"]], title="Test Case Summary")
-    st.plotly_chart(fig)
+    with recorder.stage("chart build"):
+        fig = px.bar(chart_data.classname_rollup(table), x="classname", y=["passed", "failed"], title="Test Cases per Classname")
+    with recorder.stage("chart render"):
+        st.plotly_chart(fig)
+
+    with recorder.stage("chart build"):
+        fig = px.bar(chart_data.time_histogram(table), x="bin_start", y="count", color="status", title="Execution Time Distribution")
+    with recorder.stage("chart render"):
+        st.plotly_chart(fig)
+
+    with recorder.stage("chart build"):
+        fig = px.pie(names=["Passed", "Failed"], values=[results["Passed Tests"], results["Failed Tests"]], title="Test Case Summary")
+    with recorder.stage("chart render"):
+        st.plotly_chart(fig)
 
 # Streamlit UI
 st.title("JSON Ollama Parser with Graphs")
 
-uploaded_file = st.file_uploader("Upload XML Test Results", type="xml")
-
-if uploaded_file is not None:
-    results = parse_test_results(uploaded_file)
-    plot_graphs(results)
-    graph_summary = generate_graph_summaries(results)
-    if st.button("Push to Ollama"):
-        push_to_ollama(results, graph_summary)
+uploaded_files = st.file_uploader("Upload XML Test Results", type=["xml", "zip"], accept_multiple_files=True)
+
+results = None
+diff = None
+if uploaded_files:
+    results = page.parse_test_results(uploaded_files)
+    if results is not None:
+        diff = page.track_previous_run(results)
+        plot_graphs(results)
+        with st.expander("Test Cases"):
+            page.show_test_cases(results)
+        page.show_run_history(results, uploaded_files)
+        page.show_failure_triage(results)
+        if diff is not None:
+            page.show_changes(diff)
+        graph_summary = summaries.generate_graph_summaries(results)
+        if st.button("Push to Ollama"):
+            page.push_to_ollama(results, diff, extra_texts=[graph_summary])
+        pushed = page.finished_job("push_job", "Failed to push data to Ollama")
+        if pushed is not None:
+            st.session_state["index_path"] = pushed.result
+            st.success(f"Data and graph summaries pushed to Ollama successfully! ({pushed.message})")
 
 st.subheader("Ask Questions About the Test Results and Graphs:")
 question = st.text_input("Enter your question:")
 if st.button("Query Ollama"):
     if question:
-        answer = query_ollama(question)
-        st.text_area("Answer:", answer, height=200)
+        answer = page.query_ollama(question, results, diff)
+        if answer is not None:
+            # Any widget click reruns the script, which closes the stream and stops generation
+            st.button("Stop")
+            st.write_stream(answer)
+            st.caption(llm_client.format_stream_stats(answer.stats))
+            st.caption(local_answers.format_routes(answer.stats))
+            st.caption(response_cache.format_stats(llm_cache.stats()))
+
+# Performance panel: per-stage timings for this run of the page
+with st.expander("Performance"):
+    st.checkbox("Trace memory (slower)", key="trace_memory")
+    st.dataframe(recorder.rows())
+    st.write("Model load and eval time:")
+    st.dataframe(llm.timings.rows())
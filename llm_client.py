@@ -0,0 +1,738 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+GEMINI_HOST = os.environ.get("GEMINI_HOST", "https://generativelanguage.googleapis.com")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", "15"))
+
+# (connect, read) seconds; generation on CPU can legitimately take minutes
+DEFAULT_TIMEOUT = (3.05, 300)
+
+# How long Ollama keeps a model in memory after its last request. Its own
+# default of five minutes unloads the models between questions, and every
+# reload costs tens of seconds, so requests ask for longer.
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Models the Ollama server holds in memory at once; keep it in line with the
+# server's own setting of the same name. Requests for more models than this
+# wait their turn instead of making the server swap models in and out.
+MAX_LOADED_MODELS = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS", "2"))
+
+# Requests a running model takes while another model waits for a slot
+MODEL_BATCH = 16
+
+# A load_duration above this means the request waited for the model to load
+COLD_LOAD_SECONDS = 0.5
+
+# Seconds a /api/ps answer is reused for
+LOADED_TTL = 5.0
+
+# Named model choices the apps pick from per request, as "provider:model".
+# A profile may list alternatives separated by "|"; the first one whose model
+# is already loaded is used, and the first one when none is, so a quick answer
+# can come from the bigger model rather than unloading it to load the small one.
+# LLM_PROFILES overrides or adds entries ("quick=ollama:phi3,deep=gemini:gemini-1.5-pro").
+PROFILES = {
+    "quick": "ollama:tinyllama:1.1b|ollama:llama3",
+    "deep": "ollama:llama3",
+    "gemini": "gemini:" + GEMINI_MODEL,
+    "embed": "ollama:" + os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text"),
+}
+for _entry in filter(None, os.environ.get("LLM_PROFILES", "").split(",")):
+    _name, _, _spec = _entry.partition("=")
+    PROFILES[_name.strip()] = _spec.strip()
+
+# Send every request to one provider whatever the profile says, e.g.
+# LLM_BACKEND=fake to run the apps and benchmarks offline
+LLM_BACKEND = os.environ.get("LLM_BACKEND") or None
+
+
+# Raised for problems with the backend setup rather than the request, such as
+# a missing API key. It is a RequestException so the apps' existing handlers
+# report it.
+class BackendError(requests.exceptions.RequestException):
+    pass
+
+
+# Token bucket: requests_per_minute on average, with up to burst sent back to
+# back. wait() reserves a token and sleeps until it is due.
+class RateLimiter:
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1.0, requests_per_minute / 6)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+# Admits requests to at most max_models distinct models at a time. Requests
+# for a model that is already running join it, so requests for one model are
+# batched together rather than interleaved with another's. Once a request for
+# another model is waiting, a running model takes at most max_batch more
+# requests before it has to drain and make room, so no model is starved; free
+# model slots go to the models that have waited longest.
+class ModelScheduler:
+    def __init__(self, max_models=MAX_LOADED_MODELS, max_batch=MODEL_BATCH):
+        self.max_models = max_models
+        self.max_batch = max_batch
+        self._active = {}
+        self._joined = {}
+        self._waiting = []
+        self._changed = threading.Condition()
+
+    def acquire(self, model):
+        with self._changed:
+            ticket = (object(), model)
+            self._waiting.append(ticket)
+            while not self._admissible(ticket):
+                self._changed.wait()
+            self._waiting.remove(ticket)
+            if model in self._active and self._starving():
+                self._joined[model] = self._joined.get(model, 0) + 1
+            self._active[model] = self._active.get(model, 0) + 1
+
+    def release(self, model):
+        with self._changed:
+            self._active[model] -= 1
+            if not self._active[model]:
+                del self._active[model]
+                self._joined.pop(model, None)
+            self._changed.notify_all()
+
+    # Whether a request is waiting for a model that is not running
+    def _starving(self):
+        return any(waiting not in self._active for _, waiting in self._waiting)
+
+    def _admissible(self, ticket):
+        model = ticket[1]
+        if model in self._active:
+            return self._joined.get(model, 0) < self.max_batch or not self._starving()
+        ahead = set()
+        for waiting in self._waiting:
+            if waiting is ticket:
+                break
+            if waiting[1] != model and waiting[1] not in self._active:
+                ahead.add(waiting[1])
+        return len(ahead) < self.max_models - len(self._active)
+
+    def active(self):
+        with self._changed:
+            return dict(self._active)
+
+
+# Load and eval time per model, from the durations Ollama reports with each
+# response, to see how much time goes to loading models rather than answering
+class ModelTimings:
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, response):
+        def seconds(field):
+            return (response.get(field) or 0) / 1e9
+
+        with self._lock:
+            row = self._rows.setdefault(model, {
+                "model": model, "requests": 0, "cold_loads": 0, "load_s": 0.0, "prompt_eval_s": 0.0, "eval_s": 0.0,
+            })
+            row["requests"] += 1
+            if seconds("load_duration") >= COLD_LOAD_SECONDS:
+                row["cold_loads"] += 1
+            row["load_s"] += seconds("load_duration")
+            row["prompt_eval_s"] += seconds("prompt_eval_duration")
+            row["eval_s"] += seconds("eval_duration")
+
+    # Rows for st.dataframe
+    def rows(self):
+        with self._lock:
+            rows = [dict(row) for row in self._rows.values()]
+        for row in rows:
+            for field in ("load_s", "prompt_eval_s", "eval_s"):
+                row[field] = round(row[field], 2)
+        return rows
+
+
+# Common interface of every LLM backend. Subclasses implement _generate,
+# _chat, _embed, _stream_generate and _stream_chat with Ollama-shaped
+# requests and responses; this class bounds them to max_concurrency calls in
+# flight (a stream holds its slot until it finishes or is dropped), applies
+# the optional rate limit and model scheduler, records per-model timings and
+# provides the async and batch methods.
+class Backend:
+    provider = None
+
+    def __init__(self, max_concurrency=4, requests_per_minute=None):
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=self.provider)
+        self.scheduler = None
+        self.timings = ModelTimings()
+
+    def generate(self, model, prompt, **options):
+        return self._call(self._generate, model, prompt, **options)
+
+    def chat(self, model, messages, **options):
+        return self._call(self._chat, model, messages, **options)
+
+    # Embed a batch of texts in one request; returns one vector per text
+    def embed(self, model, texts):
+        return self._call(self._embed, model, list(texts))
+
+    # Start a streamed generation; the request is sent straight away so HTTP
+    # errors surface here, and tokens are read as the TokenStream is iterated
+    def stream_generate(self, model, prompt, **options):
+        return self._open_stream(self._stream_generate, model, prompt, **options)
+
+    def stream_chat(self, model, messages, **options):
+        return self._open_stream(self._stream_chat, model, messages, **options)
+
+    # Load a model ahead of its first request; returns the seconds the load
+    # took. Only backends that load models themselves do anything here.
+    def warm(self, model, embed=False):
+        return 0.0
+
+    # Whether the model is known to be in memory already
+    def is_loaded(self, model):
+        return False
+
+    # Every method's first argument is the model. The model scheduler comes
+    # first, so a request waiting for its model does not hold a slot.
+    def _acquire(self, model):
+        if self.scheduler is not None:
+            self.scheduler.acquire(model)
+        self._slots.acquire()
+        if self._limiter is not None:
+            self._limiter.wait()
+
+    def _release(self, model):
+        self._slots.release()
+        if self.scheduler is not None:
+            self.scheduler.release(model)
+
+    def _call(self, method, model, *args, **options):
+        self._acquire(model)
+        try:
+            response = method(model, *args, **options)
+        finally:
+            self._release(model)
+        if isinstance(response, dict):
+            self.timings.record(model, response)
+        return response
+
+    def _open_stream(self, method, model, *args, **options):
+        self._acquire(model)
+        try:
+            stream = method(model, *args, **options)
+        except BaseException:
+            self._release(model)
+            raise
+        released = threading.Lock()
+
+        def release(*_):
+            if released.acquire(blocking=False):
+                self._release(model)
+
+        # A stream that is never iterated gives its slot back when collected
+        stream.add_finish_callback(release)
+        stream.add_finish_callback(lambda done: self.timings.record(model, done.stats))
+        weakref.finalize(stream, release)
+        return stream
+
+    async def agenerate(self, model, prompt, **options):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.generate(model, prompt, **options))
+
+    async def achat(self, model, messages, **options):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.chat(model, messages, **options))
+
+    async def aembed(self, model, texts):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.embed(model, texts))
+
+    # Run many prompts concurrently; results come back in prompt order, with
+    # the exception in place of the response for any prompt that failed
+    async def generate_many(self, model, prompts, **options):
+        tasks = [self.agenerate(model, prompt, **options) for prompt in prompts]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+# Pooled keep-alive session retrying connection errors and 429/5xx responses
+# with exponential backoff
+def _retrying_session(retries, backoff, pool_size):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 10), max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Thin Ollama HTTP client over one pooled keep-alive session. Every request
+# asks the server to keep its model loaded for keep_alive, and requests are
+# scheduled so no more than max_loaded_models models are in use at once.
+class OllamaClient(Backend):
+    provider = "ollama"
+
+    def __init__(self, host=OLLAMA_HOST, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5, max_concurrency=4,
+                 requests_per_minute=None, keep_alive=KEEP_ALIVE, max_loaded_models=MAX_LOADED_MODELS):
+        super().__init__(max_concurrency, requests_per_minute)
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.session = _retrying_session(retries, backoff, max_concurrency)
+        self.scheduler = ModelScheduler(max_loaded_models)
+        self._loaded = None
+
+    # POST a JSON payload to an API path; raises requests.HTTPError on non-2xx
+    def post(self, path, payload, timeout=None):
+        response = self.session.post(f"{self.host}{path}", json=payload, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def warm(self, model, embed=False):
+        response = self._call(self._warm, model, embed)
+        return (response.get("load_duration") or 0) / 1e9
+
+    # An empty generate request only loads the model; embedding models have
+    # no generate endpoint, so they embed a word instead
+    def _warm(self, model, embed):
+        if embed:
+            return self.post("/api/embed", {"model": model, "input": "warm up", "keep_alive": self.keep_alive})
+        return self.post("/api/generate", {"model": model, "stream": False, "keep_alive": self.keep_alive})
+
+    def is_loaded(self, model):
+        loaded = self.loaded_models()
+        return loaded is not None and _tagged(model) in loaded
+
+    # Names of the models the server holds in memory, from /api/ps, at most
+    # LOADED_TTL seconds old; None when the server cannot be asked
+    def loaded_models(self):
+        now = time.monotonic()
+        if self._loaded is None or now - self._loaded[0] > LOADED_TTL:
+            try:
+                # No retries: this is only a hint, and the page waits on it
+                response = requests.get(f"{self.host}/api/ps", timeout=(1, 2))
+                response.raise_for_status()
+                loaded = {_tagged(entry.get("model") or entry["name"]) for entry in response.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                loaded = None
+            self._loaded = (now, loaded)
+        return self._loaded[1]
+
+    def _generate(self, model, prompt, **options):
+        payload = {"model": model, "prompt": prompt, "stream": False, "keep_alive": self.keep_alive, **options}
+        return self.post("/api/generate", payload)
+
+    def _chat(self, model, messages, **options):
+        payload = {"model": model, "messages": messages, "stream": False, "keep_alive": self.keep_alive, **options}
+        return self.post("/api/chat", payload)
+
+    # The embeddings come back as a list, so their timings are recorded here
+    def _embed(self, model, texts):
+        response = self.post("/api/embed", {"model": model, "input": texts, "keep_alive": self.keep_alive})
+        self.timings.record(model, response)
+        return response["embeddings"]
+
+    def _stream_generate(self, model, prompt, **options):
+        payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive, **options}
+        return self._stream("/api/generate", payload, generate_text)
+
+    def _stream_chat(self, model, messages, **options):
+        payload = {"model": model, "messages": messages, "stream": True, "keep_alive": self.keep_alive, **options}
+        return self._stream("/api/chat", payload, chat_text)
+
+    def _stream(self, path, payload, text_of):
+        started = time.perf_counter()
+        response = self.session.post(f"{self.host}{path}", json=payload, timeout=self.timeout, stream=True)
+        response.raise_for_status()
+        # chunk_size=None hands over each chunk as it arrives instead of waiting
+        # for a full read buffer, which would hide the real time to first token
+        chunks = (json.loads(line) for line in response.iter_lines(chunk_size=None) if line)
+        return TokenStream(chunks, text_of, on_close=response.close, started=started)
+
+    def close(self):
+        super().close()
+        self.session.close()
+
+
+# Ollama names an untagged model "name:latest"
+def _tagged(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+# Gemini REST API behind the same interface. Requests and responses are
+# translated to and from Ollama's shapes, so callers and the TokenStream
+# stats see no difference. The key comes from GEMINI_API_KEY and is sent in a
+# header, never in the URL. The free tier allows only a few requests a
+# minute, hence the default rate limit.
+class GeminiBackend(Backend):
+    provider = "gemini"
+
+    # Ollama options with a Gemini generationConfig equivalent
+    OPTIONS = {"temperature": "temperature", "top_p": "topP", "top_k": "topK", "num_predict": "maxOutputTokens", "stop": "stopSequences"}
+
+    def __init__(self, host=GEMINI_HOST, api_key=None, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5,
+                 max_concurrency=4, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE):
+        super().__init__(max_concurrency, requests_per_minute)
+        self.host = host.rstrip("/")
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        self.timeout = timeout
+        self.session = _retrying_session(retries, backoff, max_concurrency)
+
+    def _post(self, model, method, payload, stream=False):
+        if not self.api_key:
+            raise BackendError("GEMINI_API_KEY is not set")
+        response = self.session.post(
+            f"{self.host}/v1beta/models/{model}:{method}",
+            json=payload,
+            headers={"x-goog-api-key": self.api_key},
+            timeout=self.timeout,
+            stream=stream,
+        )
+        response.raise_for_status()
+        return response
+
+    def _request(self, messages, options):
+        contents = []
+        system = []
+        for message in messages:
+            if message["role"] == "system":
+                system.append({"text": message["content"]})
+            else:
+                role = "model" if message["role"] == "assistant" else "user"
+                contents.append({"role": role, "parts": [{"text": message["content"]}]})
+        payload = {"contents": contents}
+        if system:
+            payload["systemInstruction"] = {"parts": system}
+        # Other Ollama fields (keep_alive, format, ...) have no equivalent and are dropped
+        config = {self.OPTIONS[name]: value for name, value in options.get("options", {}).items() if name in self.OPTIONS}
+        if config:
+            payload["generationConfig"] = config
+        return payload
+
+    @staticmethod
+    def _chunk(model, data):
+        candidate = (data.get("candidates") or [{}])[0]
+        text = "".join(part.get("text", "") for part in candidate.get("content", {}).get("parts", []))
+        chunk = {"model": model, "response": text, "message": {"role": "assistant", "content": text}}
+        if candidate.get("finishReason"):
+            usage = data.get("usageMetadata", {})
+            chunk.update(done=True, done_reason=candidate["finishReason"].lower(),
+                         eval_count=usage.get("candidatesTokenCount"), prompt_eval_count=usage.get("promptTokenCount"))
+        return chunk
+
+    def _generate(self, model, prompt, **options):
+        return self._chat(model, [{"role": "user", "content": prompt}], **options)
+
+    def _chat(self, model, messages, **options):
+        response = self._post(model, "generateContent", self._request(messages, options))
+        return self._chunk(model, response.json())
+
+    def _embed(self, model, texts):
+        requests_ = [{"model": f"models/{model}", "content": {"parts": [{"text": text}]}} for text in texts]
+        response = self._post(model, "batchEmbedContents", {"requests": requests_})
+        return [embedding["values"] for embedding in response.json()["embeddings"]]
+
+    def _stream_generate(self, model, prompt, **options):
+        return self._stream(model, [{"role": "user", "content": prompt}], options, generate_text)
+
+    def _stream_chat(self, model, messages, **options):
+        return self._stream(model, messages, options, chat_text)
+
+    def _stream(self, model, messages, options, text_of):
+        started = time.perf_counter()
+        response = self._post(model, "streamGenerateContent?alt=sse", self._request(messages, options), stream=True)
+        chunks = (
+            self._chunk(model, json.loads(line[len(b"data: "):]))
+            for line in response.iter_lines(chunk_size=None)
+            if line.startswith(b"data: ")
+        )
+        return TokenStream(chunks, text_of, on_close=response.close, started=started)
+
+    def close(self):
+        super().close()
+        self.session.close()
+
+
+# Deterministic offline backend: no network, answers derived from the prompt
+# and hashed bag-of-words embeddings, so the pipeline can be tested and its
+# own overhead benchmarked without a model. token_delay paces the streams.
+class FakeBackend(Backend):
+    provider = "fake"
+
+    def __init__(self, token_delay=float(os.environ.get("LLM_FAKE_TOKEN_DELAY", "0")), dimensions=64, max_concurrency=4, requests_per_minute=None):
+        super().__init__(max_concurrency, requests_per_minute)
+        self.token_delay = token_delay
+        self.dimensions = dimensions
+
+    @staticmethod
+    def _answer(model, text):
+        return f"Fake answer {zlib.crc32(text.encode()):08x} from {model} to a {len(text)} character prompt.".split(" ")
+
+    @staticmethod
+    def _final(model, words, text):
+        return {"model": model, "done": True, "done_reason": "stop", "eval_count": len(words), "prompt_eval_count": len(text.split())}
+
+    def _generate(self, model, prompt, **options):
+        words = self._answer(model, prompt)
+        return {**self._final(model, words, prompt), "response": " ".join(words)}
+
+    def _chat(self, model, messages, **options):
+        text = "\n".join(message["content"] for message in messages)
+        words = self._answer(model, text)
+        return {**self._final(model, words, text), "message": {"role": "assistant", "content": " ".join(words)}}
+
+    def _embed(self, model, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % self.dimensions] += 1.0
+            vectors.append(vector)
+        return vectors
+
+    def _stream_generate(self, model, prompt, **options):
+        return TokenStream(self._chunks(model, prompt, "response"), generate_text)
+
+    def _stream_chat(self, model, messages, **options):
+        text = "\n".join(message["content"] for message in messages)
+        return TokenStream(self._chunks(model, text, "message"), chat_text)
+
+    def _chunks(self, model, text, field):
+        words = self._answer(model, text)
+        for i, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            piece = word if i == 0 else " " + word
+            yield {"response": piece} if field == "response" else {"message": {"role": "assistant", "content": piece}}
+        yield self._final(model, words, text)
+
+
+BACKENDS = {"ollama": OllamaClient, "gemini": GeminiBackend, "fake": FakeBackend}
+
+
+def generate_text(chunk):
+    return chunk.get("response", "")
+
+
+def chat_text(chunk):
+    return chunk["message"]["content"] if chunk.get("message") else ""
+
+
+# Wraps a stream of Ollama-shaped chunks (JSON dicts from any backend)
+# and yields just the text, timing time-to-first-token and tokens/sec as it
+# goes, measured from when the request was sent. cancel() stops the stream at the next chunk and closes the connection,
+# which makes Ollama abandon the generation.
+class TokenStream:
+    def __init__(self, chunks, text_of, on_close=None, started=None):
+        self._chunks = chunks
+        self._started = started if started is not None else time.perf_counter()
+        self._text_of = text_of
+        self._on_close = on_close
+        self._cancelled = threading.Event()
+        self._finish_callbacks = []
+        self.text = ""
+        self.completed = False
+        self.stats = {"time_to_first_token": None, "tokens": 0, "tokens_per_sec": None, "elapsed": None, "cancelled": False}
+
+    def __iter__(self):
+        start = self._started
+        parts = []
+        try:
+            for chunk in self._chunks:
+                if self._cancelled.is_set():
+                    break
+                text = self._text_of(chunk)
+                if text:
+                    if self.stats["time_to_first_token"] is None:
+                        self.stats["time_to_first_token"] = time.perf_counter() - start
+                    self.stats["tokens"] += 1
+                    parts.append(text)
+                    yield text
+                if chunk.get("done"):
+                    self.completed = True
+                    self._record_final(chunk)
+        finally:
+            self.text = "".join(parts)
+            self._finish(start)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    # Called with the stream once iteration ends, whether it completed or not
+    def add_finish_callback(self, callback):
+        self._finish_callbacks.append(callback)
+
+    def _record_final(self, chunk):
+        for field in ("eval_count", "eval_duration", "prompt_eval_count", "prompt_eval_duration", "load_duration", "total_duration"):
+            if chunk.get(field) is not None:
+                self.stats[field] = chunk.get(field)
+
+    def _finish(self, start):
+        elapsed = time.perf_counter() - start
+        self.stats["elapsed"] = elapsed
+        self.stats["cancelled"] = self._cancelled.is_set()
+        # Prefer Ollama's own eval timing; fall back to wall clock after the first token
+        if self.stats.get("eval_count") and self.stats.get("eval_duration"):
+            self.stats["tokens_per_sec"] = self.stats["eval_count"] / (self.stats["eval_duration"] / 1e9)
+        elif self.stats["tokens"] and self.stats["time_to_first_token"] is not None:
+            generating = elapsed - self.stats["time_to_first_token"]
+            if generating > 0:
+                self.stats["tokens_per_sec"] = (self.stats["tokens"] - 1) / generating
+        if self._on_close is not None:
+            self._on_close()
+        elif hasattr(self._chunks, "close"):
+            self._chunks.close()
+        for callback in self._finish_callbacks:
+            callback(self)
+
+
+# One-line summary of a finished TokenStream for st.caption
+def format_stream_stats(stats):
+    parts = []
+    if stats["time_to_first_token"] is not None:
+        parts.append(f"first token after {stats['time_to_first_token']:.2f}s")
+    parts.append(f"{stats.get('eval_count') or stats['tokens']} tokens")
+    if stats["tokens_per_sec"]:
+        parts.append(f"{stats['tokens_per_sec']:.1f} tokens/s")
+    if stats["cancelled"]:
+        parts.append("cancelled")
+    if stats.get("cached"):
+        parts.append("served from cache")
+    # A cold load is most of the wait, so say so when there was one
+    if (stats.get("load_duration") or 0) >= COLD_LOAD_SECONDS * 1e9:
+        parts.append(f"model loaded in {stats['load_duration'] / 1e9:.1f}s")
+    return " · ".join(parts)
+
+
+# "provider:model" into its parts. A bare model name, or one whose prefix is
+# not a provider ("tinyllama:1.1b"), is an Ollama model.
+def parse_spec(spec):
+    provider, sep, model = spec.partition(":")
+    if not sep or provider not in BACKENDS:
+        provider, model = "ollama", spec
+    return LLM_BACKEND or provider, model
+
+
+# A new backend the caller owns and closes. host only applies to Ollama.
+def create_backend(provider, host=None, **options):
+    if provider not in BACKENDS:
+        raise BackendError(f"Unknown LLM backend {provider!r}; expected one of {', '.join(BACKENDS)}")
+    if host is not None and provider == "ollama":
+        options["host"] = host
+    return BACKENDS[provider](**options)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# One shared backend per provider and host, so Streamlit reruns reuse the
+# warm connections and share the concurrency and rate limits
+def get_backend(provider, host=None):
+    with _clients_lock:
+        client = _clients.get((provider, host))
+        if client is None:
+            client = _clients[provider, host] = create_backend(provider, host)
+        return client
+
+
+def get_client(host=OLLAMA_HOST):
+    return get_backend("ollama", host)
+
+
+# The shared backend and model name for a profile name or "provider:model".
+# Of a profile's alternatives, the first whose model is loaded is picked.
+def resolve(spec, host=None):
+    choices = [parse_spec(choice) for choice in PROFILES.get(spec, spec).split("|")]
+    if len(choices) > 1:
+        for provider, model in choices:
+            backend = get_backend(provider, host)
+            if backend.is_loaded(model):
+                return backend, model
+    provider, model = choices[0]
+    return get_backend(provider, host), model
+
+
+# A new backend for a profile name or "provider:model", with its own limits,
+# and the model name; the caller closes it. A profile's first choice is used.
+def open_backend(spec, host=None, **options):
+    provider, model = parse_spec(PROFILES.get(spec, spec).split("|")[0])
+    return create_backend(provider, host, **options), model
+
+
+_warmed = set()
+_warmed_lock = threading.Lock()
+
+
+# Load the models behind profiles (or "provider:model" specs) in a background
+# thread, once per process, so the first question does not wait for a cold
+# load. Models are loaded one at a time, in the order given, and no more of
+# them than the server holds at once. The "embed" profile is loaded through
+# the embedding endpoint.
+def warm_up(specs, host=None):
+    pending = []
+    with _warmed_lock:
+        for spec in specs:
+            backend, model = resolve(spec, host)
+            key = (backend.provider, host, model)
+            if backend.scheduler is None or key in _warmed:
+                continue
+            if sum(1 for warmed in _warmed if warmed[:2] == key[:2]) >= backend.scheduler.max_models:
+                continue
+            _warmed.add(key)
+            pending.append((backend, model, spec == "embed"))
+    if pending:
+        threading.Thread(target=_warm_models, args=(pending,), name="model-warm-up", daemon=True).start()
+
+
+def _warm_models(pending):
+    for backend, model, embed in pending:
+        try:
+            backend.warm(model, embed)
+        except requests.exceptions.RequestException:
+            # The first real request loads it instead
+            pass
+
+
+# Provider-qualified model name for cache keys and index paths, so answers
+# from one backend are never served for another
+def model_key(client, model):
+    return f"{client.provider}:{model}"
+
+
+# Profiles offered for answering questions, in definition order
+def answer_profiles():
+    return [name for name in PROFILES if name != "embed"]
@@ -0,0 +1,183 @@
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from llm_client import TokenStream, generate_text
+
+_route_counts = Counter()
+_route_lock = threading.Lock()
+
+_NUMBER = re.compile(r"\b(?:top|first)?\s*(\d{1,3})\b")
+
+# Local lists stop here; a longer request is told how much was left out
+MAX_LISTED = 50
+
+
+# The number of items the question asks for, which may exceed MAX_LISTED
+def _top_n(question, default=5):
+    match = _NUMBER.search(question)
+    return max(1, int(match.group(1))) if match else default
+
+
+def _slowest(results, question, fastest=False):
+    table = results["Test Cases"]
+    if not len(table):
+        return "There are no test cases in the results."
+    # "slowest test" wants one, "slowest tests" a short list
+    wanted = min(_top_n(question, 5 if re.search(r"\b(tests|cases)\b", question, re.IGNORECASE) else 1), len(table))
+    n = min(wanted, MAX_LISTED)
+    order = np.argsort(table.times, kind="stable")
+    picked = order[:n] if fastest else order[::-1][:n]
+    label = "Fastest" if fastest else "Slowest"
+    lines = [f"{label} test{'s' if n > 1 else ''}:"]
+    for i in picked:
+        case = table.record(i)
+        lines.append(f"- {case['classname']}.{case['name']}: {case['time']:.3f}s ({case['status']})")
+    if wanted > n:
+        lines.append(f"...only the first {n} of the {wanted} asked for are listed here.")
+    return "\n".join(lines)
+
+
+def _failures_by_class(results, question):
+    table = results["Test Cases"]
+    # "per suite" groups by the enclosing suite, anything else by classname
+    if re.search(r"\bsuites?\b", question, re.IGNORECASE):
+        label, groups, codes = "suite", table.suites, table.suite_codes
+    else:
+        label, groups, codes = "classname", table.classnames, table.classname_codes
+    counts = np.bincount(codes[table.failed], minlength=len(groups))
+    ranked = [(groups[code], int(counts[code])) for code in np.argsort(counts)[::-1] if counts[code]]
+    if not ranked:
+        return "No test cases failed."
+    shown = ranked[:min(_top_n(question, 20), MAX_LISTED)]
+    lines = [f"Failures per {label}:"]
+    lines.extend(f"- {group or '(no suite)'}: {count}" for group, count in shown)
+    if len(ranked) > len(shown):
+        lines.append(f"...and {len(ranked) - len(shown)} more {label}s with failures.")
+    return "\n".join(lines)
+
+
+def _failed_tests(results, question):
+    table = results["Test Cases"]
+    failed = np.flatnonzero(table.failed)
+    if not len(failed):
+        return "No test cases failed."
+    shown = failed[:min(_top_n(question, 20), MAX_LISTED)]
+    lines = [f"{len(failed)} test cases failed:"]
+    for i in shown:
+        message = table.messages[i].partition("\n")[0]
+        lines.append(f"- {table.record(i)['classname']}.{table.names[i]}" + (f": {message}" if message else ""))
+    if len(failed) > len(shown):
+        lines.append(f"...and {len(failed) - len(shown)} more.")
+    return "\n".join(lines)
+
+
+def _rate(results, passed):
+    total = results["Total Tests"]
+    if not total:
+        return "There are no tests in the results."
+    count = results["Passed Tests"] if passed else results["Failed Tests"]
+    label = "Pass" if passed else "Failure"
+    return f"{label} rate: {count / total:.1%} ({count} of {total} tests)."
+
+
+# Failed tests include the errors, so the three parts add up to the total
+def _total_count(results, question):
+    errors = f" ({results['Error Tests']} of them errors)" if results["Error Tests"] else ""
+    return (
+        f"There are {results['Total Tests']} tests: {results['Passed Tests']} passed, "
+        f"{results['Failed Tests']} failed{errors} and {results['Skipped Tests']} skipped."
+    )
+
+
+def _time_stat(results, which):
+    stats = results["Test Cases"].stats()
+    if which == "total":
+        return f"Total execution time: {float(results['Test Cases'].times.sum()):.2f}s across {stats['total']} test cases."
+    return f"Average execution time: {stats['avg_time']:.2f}s (min {stats['min_time']:.2f}s, max {stats['max_time']:.2f}s)."
+
+
+# Questions that narrow or explain the tests they ask about (a time
+# threshold, a cause, a condition) need the model even when they start like
+# one of the plain questions below
+_QUALIFIED = re.compile(
+    r"\b(than|over|under|above|below|at (least|most)|between|due to|because|caused|why|reason|with|without|"
+    r"where|whose|that (have|had|contain)|containing|matching|named|except)\b|\d\s*(ms|s|secs?|seconds?|minutes?)\b",
+    re.IGNORECASE,
+)
+
+# So do questions scoped to part of the run ("in pkg3", "for pkg3.Class1",
+# "of each class"): the handlers answer for the whole run. Only the words
+# that name the whole run or its tests may follow the preposition.
+_WHOLE_RUN = r"(the |this |all |these )?(run|report|results?|tests?|test cases?|cases?|total|failures|failed|failing|passed|passing|errors)\b"
+_SCOPED = re.compile(rf"\b(in|for|of|within|from|inside) (?!{_WHOLE_RUN})\S", re.IGNORECASE)
+
+# The plain counts match the whole question, so only "how many tests failed"
+# and its rewordings are counted locally
+_TESTS = r"(tests?|test cases?|cases?)"
+_TAIL = r"( (are|were) there| in total| overall| in (the|this) (run|report|results?))?"
+_HOW_MANY = r"^(how many|(the )?(total )?(number|count) of)"
+
+# (intent, pattern, handler) in priority order; the first match wins, so the
+# more specific questions (per class, rates, lists) come before plain counts
+_INTENTS = [
+    ("failures_by_class", r"\b(per|by|each|which) (class(es|names?)?|suites?)\b.*\bfail|\bfail\w*\b.*\b(per|by|each) (class(es|names?)?|suites?)\b|\b(class(es|names?)?|suites?)\b.*\bmost\b.*\bfail", _failures_by_class),
+    ("pass_rate", r"\b(pass|success)(ing)? (rate|ratio|percentage)\b|\bpercent(age)? (of tests )?pass", lambda r, q: _rate(r, True)),
+    ("failure_rate", r"\b(fail(ure)?|error) (rate|ratio|percentage)\b|\bpercent(age)? (of tests )?fail", lambda r, q: _rate(r, False)),
+    ("slowest_tests", r"\b(slowest|longest|took the (most|longest)|most time)\b", _slowest),
+    ("fastest_tests", r"\b(fastest|quickest|shortest|least time)\b", lambda r, q: _slowest(r, q, fastest=True)),
+    ("failed_tests", rf"\b(which|what|list|show|name)\b.*\b{_TESTS}\b.*\bfail|^(list|show)( me)?( all| the)* (failed|failing) {_TESTS}$|^(list|show)( me)?( all| the)* failures$", _failed_tests),
+    ("failed_count", rf"{_HOW_MANY}( {_TESTS})? (failed|fail|did fail|are failing|were failing)( {_TESTS})?{_TAIL}$|{_HOW_MANY} (failed|failing) {_TESTS}{_TAIL}$|{_HOW_MANY} failures{_TAIL}$|^(failed {_TESTS}|failure) count$", lambda r, q: f"{r['Failed Tests']} of {r['Total Tests']} tests failed."),
+    ("passed_count", rf"{_HOW_MANY}( {_TESTS})? (passed|pass|did pass|are passing|were passing)( {_TESTS})?{_TAIL}$|{_HOW_MANY} (passed|passing) {_TESTS}{_TAIL}$|^passed {_TESTS} count$", lambda r, q: f"{r['Passed Tests']} of {r['Total Tests']} tests passed."),
+    ("total_time", r"^(what is |what's )?(the )?total (execution |run )?time( of (the|this) (run|suite))?$|^how long did (the )?(suite|run|tests?) take$", lambda r, q: _time_stat(r, "total")),
+    ("average_time", r"^(what is |what's )?(the )?(average|mean|avg) (execution |run |test )?time( per test)?$", lambda r, q: _time_stat(r, "average")),
+    ("total_count", rf"{_HOW_MANY} {_TESTS}( (are there|were (there|run)|ran|did (we|it) run)| in total| overall| in (the|this) (run|report|results?))?$", _total_count),
+]
+_INTENTS = [(intent, re.compile(pattern, re.IGNORECASE), handler) for intent, pattern, handler in _INTENTS]
+
+
+# Answer plain aggregate questions exactly from the parsed results. Returns
+# (intent, answer) or None when the question needs the model.
+def answer_locally(question, results):
+    if results is None or _QUALIFIED.search(question) or _SCOPED.search(question):
+        return None
+    question = question.strip().rstrip("?.! ")
+    for intent, pattern, handler in _INTENTS:
+        if pattern.search(question):
+            return intent, handler(results, question)
+    return None
+
+
+# Try the local path first and fall back to start_stream() for open-ended
+# questions. The returned stream's stats record which path served it.
+def route_question(question, results, start_stream):
+    started = time.perf_counter()
+    local = answer_locally(question, results)
+    if local is not None:
+        intent, answer = local
+        stream = TokenStream([{"response": answer, "done": True}], generate_text, started=started)
+        stream.stats["route"] = f"local ({intent})"
+        record_route("local")
+        return stream
+
+    stream = start_stream()
+    if stream is not None:
+        route = "cache" if stream.stats.get("cached") else "model"
+        stream.stats["route"] = route
+        record_route(route)
+    return stream
+
+
+def record_route(route):
+    with _route_lock:
+        _route_counts[route] += 1
+
+
+def format_routes(stats):
+    with _route_lock:
+        counts = dict(_route_counts)
+    totals = ", ".join(f"{counts.get(route, 0)} {route}" for route in ("local", "cache", "model"))
+    return f"Answered by: {stats.get('route', 'model')} · since start: {totals}"
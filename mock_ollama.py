@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal stand-in for the Ollama HTTP API, for exercising the client layer
+# and benchmarks without a model. Answers are deterministic: the reply echoes
+# the prompt length so callers can tell requests apart. With load_delay set,
+# the stub also holds at most max_loaded models in memory like the real
+# server: a request for a model that is not loaded first waits load_delay
+# (loads happen one at a time), evicting the least recently used model, and
+# reports the wait as load_duration.
+
+EMBED_DIM = 64
+
+
+# Hashed bag of words, so texts sharing words get similar vectors
+def _embed(text):
+    vector = [0.0] * EMBED_DIM
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode()) % EMBED_DIM] += 1.0
+    return vector
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, payload))
+            failing = server.fail_next > 0
+            if failing:
+                server.fail_next -= 1
+
+        if failing:
+            self._send_json(503, {"error": "model is loading"})
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        self.load_duration = self._load(payload.get("model", ""))
+
+        if self.path == "/api/generate":
+            answer = f"stub answer ({len(payload.get('prompt', ''))} chars)"
+            self._reply(payload, answer, lambda text: {"response": text})
+        elif self.path == "/api/chat":
+            content = "".join(message.get("content", "") for message in payload.get("messages", []))
+            answer = f"stub answer ({len(content)} chars)"
+            self._reply(payload, answer, lambda text: {"message": {"role": "assistant", "content": text}})
+        elif self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json(200, {
+                "model": payload.get("model", ""), "embeddings": [_embed(text) for text in inputs],
+                "load_duration": self.load_duration,
+            })
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            with self.server.lock:
+                models = [{"name": model, "model": model} for model in self.server.loaded]
+            self._send_json(200, {"models": models})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    # Nanoseconds spent loading the model for this request
+    def _load(self, model):
+        server = self.server
+        if not server.load_delay:
+            return 0
+        model = model if ":" in model else f"{model}:latest"
+        started = time.perf_counter()
+        with server.load_lock:
+            with server.lock:
+                if model in server.loaded:
+                    server.loaded.move_to_end(model)
+                    return int((time.perf_counter() - started) * 1e9)
+            time.sleep(server.load_delay)
+            with server.lock:
+                server.loads += 1
+                server.loaded[model] = True
+                while len(server.loaded) > server.max_loaded:
+                    server.loaded.popitem(last=False)
+        return int((time.perf_counter() - started) * 1e9)
+
+    def _reply(self, payload, answer, wrap):
+        tokens = answer.split(" ")
+        if not payload.get("stream", True):
+            self._send_json(200, self._completion(payload, wrap(answer), done=True, tokens=len(tokens)))
+            return
+
+        # Chunked NDJSON like the real server: one chunk per word, then a done chunk
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                text = token if i == 0 else f" {token}"
+                self._write_chunk(self._completion(payload, wrap(text)))
+                if self.server.token_delay:
+                    time.sleep(self.server.token_delay)
+            self._write_chunk(self._completion(payload, wrap(""), done=True, tokens=len(tokens)))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _write_chunk(self, body):
+        data = json.dumps(body).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _completion(self, payload, body, done=False, tokens=0):
+        chunk = {"model": payload.get("model", ""), "done": done, **body}
+        if done:
+            chunk.update({
+                "eval_count": tokens, "eval_duration": int(tokens * max(self.server.token_delay, 0.001) * 1e9),
+                "load_duration": self.load_duration,
+            })
+        return chunk
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+# Start a stub server on a background thread; returns (server, base_url).
+# fail_next makes the first N requests answer 503 to exercise retries,
+# token_delay paces streamed chunks, and load_delay and max_loaded simulate
+# model loading (server.loads counts the loads).
+def start_stub_server(host="127.0.0.1", port=0, delay=0.0, fail_next=0, token_delay=0.0, load_delay=0.0, max_loaded=3):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.fail_next = fail_next
+    server.token_delay = token_delay
+    server.load_delay = load_delay
+    server.max_loaded = max_loaded
+    server.loaded = OrderedDict()
+    server.loads = 0
+    server.load_lock = threading.Lock()
+    server.requests = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    stub, url = start_stub_server(port=11435)
+    print(f"Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.shutdown()
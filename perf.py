@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_FILE = os.environ.get("PERF_METRICS_FILE")
+METRICS_PORT = int(os.environ.get("PERF_METRICS_PORT") or 0)
+TRACE_MEMORY = os.environ.get("PERF_TRACE_MEMORY", "") not in ("", "0")
+
+# Wall-time histogram buckets in seconds, from a fast aggregate to a slow model call
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Fields copied from a finished TokenStream (or a non-streamed Ollama reply).
+# Ollama reports durations in nanoseconds.
+LLM_FIELDS = ("prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration", "load_duration", "total_duration")
+
+
+# tracemalloc is process-wide, so stages tracing memory on several sessions or
+# job threads at once share one trace: the first of them starts it and the
+# last stops it. A stage that starts while none is running resets the peak;
+# while stages overlap, each one's peak covers the others' allocations too.
+_tracing_lock = threading.Lock()
+_tracing_stages = 0
+_tracing_owned = False
+
+
+def _start_tracing():
+    global _tracing_stages, _tracing_owned
+    with _tracing_lock:
+        if _tracing_stages == 0:
+            # Tracing someone else started (the benchmark harness) is left running
+            _tracing_owned = not tracemalloc.is_tracing()
+            if _tracing_owned:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        _tracing_stages += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+# The peak traced allocation above `start` since the stage began
+def _stop_tracing(start):
+    global _tracing_stages
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_stages -= 1
+        if _tracing_stages == 0 and _tracing_owned:
+            tracemalloc.stop()
+        return max(0, peak - start)
+
+
+# Stage timings for one script run. stage() wraps a block and records wall
+# time, CPU time of the calling thread and, with trace_memory, the peak of
+# Python allocations made inside it. Every record is also added to the
+# process-wide metrics. Tracing memory slows allocation-heavy code down, so
+# it is off unless PERF_TRACE_MEMORY is set or the app turns it on.
+class Recorder:
+    def __init__(self, app, trace_memory=TRACE_MEMORY):
+        self.app = app
+        self.trace_memory = trace_memory
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        traced = _start_tracing() if self.trace_memory else None
+        wall, cpu = time.perf_counter(), time.thread_time()
+        record = {"stage": name, **fields}
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.thread_time() - cpu
+            if traced is not None:
+                record["peak_alloc_mb"] = _stop_tracing(traced) / (1024 * 1024)
+            self.add(record)
+
+    # Decorator form of stage()
+    def timed(self, name):
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+        METRICS.observe(self.app, record)
+
+    # Records already counted in the metrics by another recorder, such as a
+    # background job's, shown with this run's stages
+    def extend(self, records):
+        with self._lock:
+            self.records.extend(records)
+
+    # Record an LLM call once its TokenStream has finished: wall time from the
+    # request to the last token, plus Ollama's token counts and durations.
+    # Returns the stream so calls can be wrapped inline.
+    def track_stream(self, name, stream, model=None):
+        if stream is not None:
+            stream.add_finish_callback(lambda done: self.add(llm_record(name, done.stats, model)))
+        return stream
+
+    # Same for a non-streamed reply (the JSON dict from /api/generate or /api/chat)
+    def track_response(self, name, response, wall_s, model=None):
+        stats = {field: response.get(field) for field in LLM_FIELDS}
+        stats["elapsed"] = wall_s
+        self.add(llm_record(name, stats, model or response.get("model")))
+        return response
+
+    # Rows for st.dataframe, durations in milliseconds
+    def rows(self):
+        with self._lock:
+            records = list(self.records)
+        rows = []
+        for record in records:
+            row = {"stage": record["stage"]}
+            row["wall_ms"] = round(record["wall_s"] * 1000, 1)
+            if "cpu_s" in record:
+                row["cpu_ms"] = round(record["cpu_s"] * 1000, 1)
+            if "peak_alloc_mb" in record:
+                row["peak_alloc_mb"] = round(record["peak_alloc_mb"], 2)
+            for field in ("prompt_tokens", "eval_tokens", "eval_ms", "load_ms", "prompt_eval_ms", "route"):
+                if record.get(field) is not None:
+                    row[field] = record[field]
+            rows.append(row)
+        return rows
+
+
+def llm_record(name, stats, model=None):
+    def ms(field):
+        value = stats.get(field)
+        return None if value is None else round(value / 1e6, 1)
+
+    return {
+        "stage": name,
+        "model": model,
+        "wall_s": stats.get("elapsed") or 0.0,
+        "ttft_s": stats.get("time_to_first_token"),
+        "prompt_tokens": stats.get("prompt_eval_count"),
+        "eval_tokens": stats.get("eval_count") or stats.get("tokens"),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "eval_ms": ms("eval_duration"),
+        "load_ms": ms("load_duration"),
+        "route": stats.get("route") or ("cache" if stats.get("cached") else None),
+    }
+
+
+# Process-wide aggregates in Prometheus text format: a wall-time histogram
+# and CPU-time sum per (app, stage), the largest traced allocation per
+# stage, and token and duration totals per model for LLM calls. Written to
+# PERF_METRICS_FILE after every record (for a node_exporter textfile
+# collector) and served on PERF_METRICS_PORT when set.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._llm = {}
+
+    def observe(self, app, record):
+        with self._lock:
+            stage = self._stages.setdefault(
+                (app, record["stage"]), {"buckets": [0] * len(BUCKETS), "count": 0, "wall": 0.0, "cpu": 0.0, "peak": 0.0}
+            )
+            wall = record["wall_s"]
+            stage["count"] += 1
+            stage["wall"] += wall
+            stage["cpu"] += record.get("cpu_s") or 0.0
+            stage["peak"] = max(stage["peak"], record.get("peak_alloc_mb") or 0.0)
+            for i, bound in enumerate(BUCKETS):
+                if wall <= bound:
+                    stage["buckets"][i] += 1
+            # Answers served locally or from the response cache never reached the model
+            if "eval_tokens" in record and record.get("route") in (None, "model"):
+                llm = self._llm.setdefault(
+                    (app, record.get("model") or "unknown"),
+                    {"calls": 0, "prompt_tokens": 0, "eval_tokens": 0, "eval_ms": 0.0, "load_ms": 0.0},
+                )
+                llm["calls"] += 1
+                for field in ("prompt_tokens", "eval_tokens", "eval_ms", "load_ms"):
+                    llm[field] += record.get(field) or 0
+        if METRICS_FILE:
+            self.write(METRICS_FILE)
+
+    def render(self):
+        with self._lock:
+            stages = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._stages.items()}
+            llm = {key: dict(value) for key, value in self._llm.items()}
+        lines = [
+            "# HELP app_stage_seconds Wall time per app stage.",
+            "# TYPE app_stage_seconds histogram",
+        ]
+        for (app, stage), value in sorted(stages.items()):
+            labels = f'app="{_escape(app)}",stage="{_escape(stage)}"'
+            for bound, count in zip(BUCKETS, value["buckets"]):
+                lines.append(f'app_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'app_stage_seconds_bucket{{{labels},le="+Inf"}} {value["count"]}')
+            lines.append(f"app_stage_seconds_sum{{{labels}}} {value['wall']:.6f}")
+            lines.append(f"app_stage_seconds_count{{{labels}}} {value['count']}")
+        lines += ["# HELP app_stage_cpu_seconds_total CPU time per app stage.", "# TYPE app_stage_cpu_seconds_total counter"]
+        for (app, stage), value in sorted(stages.items()):
+            lines.append(f'app_stage_cpu_seconds_total{{app="{_escape(app)}",stage="{_escape(stage)}"}} {value["cpu"]:.6f}')
+        lines += ["# HELP app_stage_peak_alloc_bytes Largest traced allocation peak per stage.", "# TYPE app_stage_peak_alloc_bytes gauge"]
+        for (app, stage), value in sorted(stages.items()):
+            if value["peak"]:
+                lines.append(
+                    f'app_stage_peak_alloc_bytes{{app="{_escape(app)}",stage="{_escape(stage)}"}} {int(value["peak"] * 1024 * 1024)}'
+                )
+        for metric, field, scale, help_text in (
+            ("ollama_requests_total", "calls", 1, "LLM calls."),
+            ("ollama_prompt_tokens_total", "prompt_tokens", 1, "Prompt tokens evaluated by Ollama."),
+            ("ollama_eval_tokens_total", "eval_tokens", 1, "Tokens generated."),
+            ("ollama_eval_seconds_total", "eval_ms", 1000, "Ollama eval_duration."),
+            ("ollama_load_seconds_total", "load_ms", 1000, "Ollama load_duration."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (app, model), value in sorted(llm.items()):
+                lines.append(f'{metric}{{app="{_escape(app)}",model="{_escape(model)}"}} {value[field] / scale:g}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Serve /metrics on a local port, once per process; Streamlit reruns that
+# call this again get the running server back
+def serve_metrics(port=METRICS_PORT, host="127.0.0.1"):
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
@@ -0,0 +1,108 @@
+import math
+import os
+import re
+
+from excel_reader import SheetSummary
+
+TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 3000))
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+# Rough token count for llama-style BPE vocabularies: one token per
+# punctuation mark and roughly one per four characters of each word.
+# Close enough to budget prompts without shipping a tokenizer.
+def count_tokens(text):
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text))
+
+
+def _rows_tsv(df):
+    return ["\t".join(str(value) for value in row) for row in df.itertuples(index=False)]
+
+
+# Build a compact description of a sheet that fits in `budget` tokens.
+# Sections go in priority order: schema, aggregates, failing rows, then a
+# deterministic sample of the remaining rows. Rows are tab-separated under a
+# header that is written once. Returns (text, report), where the report
+# records the tokens used and how many rows of each kind made it in.
+def build_dataframe_context(df, budget=TOKEN_BUDGET, status_column="Status", max_failing=200):
+    summary = SheetSummary(status_column, max_failing)
+    summary.update(df)
+    return build_summary_context(summary, budget)
+
+
+# Same as build_dataframe_context, from a SheetSummary streamed out of the
+# workbook, so the sheet itself never has to be loaded whole
+def build_summary_context(summary, budget=TOKEN_BUDGET):
+    lines = []
+    used = 0
+
+    def add(line):
+        nonlocal used
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            return False
+        lines.append(line)
+        used += cost
+        return True
+
+    add(f"Sheet with {summary.rows} rows and {len(summary.columns)} columns.")
+    add("Columns: " + ", ".join(f"{column} ({dtype})" for column, dtype in summary.dtypes.items()))
+
+    if summary.status_counts:
+        counts = summary.status_counts.most_common()
+        add(f"{summary.status_column} counts: " + ", ".join(f"{value}={count}" for value, count in counts))
+    if summary.has_mismatch:
+        add(f"Rows where Expected_Status differs from Actual_Status: {summary.mismatched}")
+    for column, (low, high, total, count) in summary.numeric.items():
+        add(f"{column}: min={low}, max={high}, mean={total / count:.2f}")
+
+    header = "\t".join(str(column) for column in summary.columns)
+    report = {"budget": budget, "rows": summary.rows, "failing_rows_sent": 0, "sampled_rows_sent": 0}
+
+    # Failing rows may take up to 60% of what is left; the sample gets the rest
+    failing_limit = used + (budget - used) * 3 // 5
+    title = f"Failing rows ({summary.failing_total} total):"
+    rows = _rows_tsv(summary.failing_rows())
+    report["failing_rows_sent"], used = _add_rows(lines, title, header, rows, used, failing_limit)
+
+    rest = summary.sample_rows()
+    if len(rest):
+        # Spread the sample over the sheet, keeping the original row order
+        head = _rows_tsv(rest.head(20))
+        row_cost = max(1, sum(count_tokens(line) + 1 for line in head) // len(head))
+        step = max(1, math.ceil(len(rest) / max(1, (budget - used) // row_cost)))
+        title = f"Sample of other rows ({summary.rest_total} total):"
+        report["sampled_rows_sent"], used = _add_rows(lines, title, header, _rows_tsv(rest.iloc[::step]), used, budget)
+
+    report["tokens"] = used
+    return "\n".join(lines), report
+
+
+# Append a titled block of rows while it stays under `limit` tokens; the title
+# and header are only kept if at least one row fits. Returns the number of
+# rows added and the new token total.
+def _add_rows(lines, title, header, rows, used, limit):
+    block = [title, header]
+    block_used = used + count_tokens(title) + count_tokens(header) + 2
+    added = 0
+    for row in rows:
+        cost = count_tokens(row) + 1
+        if block_used + cost > limit:
+            break
+        block.append(row)
+        block_used += cost
+        added += 1
+    if not added:
+        return 0, used
+    lines.extend(block)
+    return added, block_used
+
+
+# One-line account of what a query sent, for st.caption
+def format_report(report, tokens_sent):
+    return (
+        f"Sent ~{tokens_sent} prompt tokens (budget {report['budget']}): "
+        f"{report['failing_rows_sent']} failing and {report['sampled_rows_sent']} sampled rows "
+        f"out of {report['rows']}"
+    )
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from llm_client import TokenStream, generate_text
+
+CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", ".llm_cache.sqlite3")
+
+
+# Lower-case, collapse whitespace and drop trailing punctuation, so "How many
+# failed?" and "how many  failed" share an entry
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip("?!. ")
+
+
+# Persistent LLM response cache in SQLite. Entries are keyed on model name,
+# normalised prompt and a dataset fingerprint, expire after ttl seconds, and
+# the least recently used ones are evicted past max_entries or max_bytes.
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, ttl=24 * 3600, max_entries=5000, max_bytes=50 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER,"
+            " created REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def key(model, prompt, dataset=""):
+        return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}\0{dataset}".encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode()), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        # Walk from least recently used until both limits hold again
+        doomed = []
+        for key, entry_size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            size -= entry_size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self):
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": size,
+        }
+
+
+# Serve a streamed answer from the cache, or start it with start_stream() and
+# store the text once it has streamed to completion. Cancelled or failed
+# streams are not cached.
+def cached_stream(cache, model, prompt, dataset, start_stream):
+    key = cache.key(model, prompt, dataset)
+    text = cache.get(key)
+    if text is not None:
+        stream = TokenStream([{"response": text, "done": True}], generate_text)
+        stream.stats["cached"] = True
+        return stream
+
+    stream = start_stream()
+    if stream is not None:
+        stream.add_finish_callback(lambda done: _store(cache, key, model, done))
+    return stream
+
+
+def _store(cache, key, model, stream):
+    if stream.completed and stream.text:
+        cache.put(key, model, stream.text)
+
+
+# Non-streaming variant: call() returns the answer text. Like a failed
+# stream, a missing or empty answer is returned but not cached.
+def cached_call(cache, model, prompt, dataset, call):
+    key = cache.key(model, prompt, dataset)
+    text = cache.get(key)
+    if text is None:
+        text = call()
+        if text:
+            cache.put(key, model, text)
+    return text
+
+
+def format_stats(stats):
+    return f"Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['entries']} entries"
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,253 @@
+import hashlib
+import sys
+from array import array
+
+import numpy as np
+
+# Per-test outcome codes. FAILED and ERROR both count as failed; SKIPPED is
+# neither passed nor failed.
+OUTCOMES = ["PASSED", "FAILED", "ERROR", "SKIPPED"]
+PASSED, FAILED, ERROR, SKIPPED = range(len(OUTCOMES))
+
+# Failure bodies are mostly stack traces; keep the top of each one
+DETAIL_CHARS = 2000
+
+
+# Column-oriented store for parsed test cases: interned names, classname codes
+# into a shared category list, a float64 time array and a boolean failed flag,
+# plus the outcome code, enclosing suite and failure type (both as codes into
+# category lists) and the failure message and body of each case. Slicing
+# returns views, and to_frame() wraps the arrays without copying them.
+class TestCaseTable:
+    def __init__(self, names, classname_codes, classnames, times, failed,
+                 outcomes, suite_codes, suites, type_codes, types, messages, details):
+        self.names = names
+        self.classname_codes = classname_codes
+        self.classnames = classnames
+        self.times = times
+        self.failed = failed
+        self.outcomes = outcomes
+        self.suite_codes = suite_codes
+        self.suites = suites
+        self.type_codes = type_codes
+        self.types = types
+        self.messages = messages
+        self.details = details
+        self._frame = None
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self.record(index)
+        return TestCaseTable(
+            self.names[index],
+            self.classname_codes[index],
+            self.classnames,
+            self.times[index],
+            self.failed[index],
+            self.outcomes[index],
+            self.suite_codes[index],
+            self.suites,
+            self.type_codes[index],
+            self.types,
+            self.messages[index],
+            self.details[index],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    # Prompts embed the table the same way they embedded the old list of dicts
+    def __repr__(self):
+        return repr(self.records())
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_frame"] = None
+        return state
+
+    def record(self, i):
+        record = {
+            "name": self.names[i],
+            "classname": self.classnames[self.classname_codes[i]],
+            "suite": self.suites[self.suite_codes[i]],
+            "time": float(self.times[i]),
+            "status": OUTCOMES[int(self.outcomes[i])],
+        }
+        # Only cases that failed, errored or were skipped carry a message
+        if self.messages[i]:
+            record["message"] = self.messages[i]
+        return record
+
+    def records(self):
+        return list(self)
+
+    # Content hash of the rows, used to key retrieval indexes and caches
+    def fingerprint(self):
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for strings in (self.names, self.classnames, self.suites, self.types, self.messages, self.details):
+                digest.update("\0".join(strings).encode())
+                digest.update(b"\1")
+            for column in (self.classname_codes, self.times, self.outcomes, self.suite_codes, self.type_codes):
+                digest.update(np.ascontiguousarray(column).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def to_frame(self):
+        if self._frame is None:
+            # pandas is imported here so headless runs that never build a frame skip it
+            import pandas as pd
+
+            self._frame = pd.DataFrame(
+                {
+                    "name": self.names,
+                    "classname": pd.Categorical.from_codes(self.classname_codes, categories=self.classnames),
+                    "suite": pd.Categorical.from_codes(self.suite_codes, categories=self.suites),
+                    "time": self.times,
+                    "status": pd.Categorical.from_codes(self.outcomes.view(np.int8), categories=OUTCOMES),
+                    "message": self.messages,
+                },
+                copy=False,
+            )
+        return self._frame
+
+    # Outcome counts and timing figures straight off the arrays
+    def stats(self):
+        counts = np.bincount(self.outcomes, minlength=len(OUTCOMES))
+        failed = int(counts[FAILED] + counts[ERROR])
+        empty = len(self) == 0
+        return {
+            "total": len(self),
+            "passed": int(counts[PASSED]),
+            "failed": failed,
+            "errors": int(counts[ERROR]),
+            "skipped": int(counts[SKIPPED]),
+            "avg_time": 0.0 if empty else float(self.times.mean()),
+            "max_time": 0.0 if empty else float(self.times.max()),
+            "min_time": 0.0 if empty else float(self.times.min()),
+        }
+
+
+# Accumulates rows in compact typed buffers while the XML is streamed, then
+# hands the buffers over to numpy in one go
+class TestCaseTableBuilder:
+    def __init__(self):
+        self._names = []
+        self._codes = array("i")
+        self._classnames = _Categories()
+        self._times = array("d")
+        self._outcomes = array("B")
+        self._suite_codes = array("i")
+        self._suites = _Categories()
+        self._types = _Categories()
+        self._types.code("")
+        # Failure type, message and body only exist for a minority of rows,
+        # so they are kept by row number and spread out in build()
+        self._failures = {}
+
+    def append(self, name, classname, time, outcome, suite="", failure_type="", message="", detail=""):
+        self.extend([(name, classname, time, outcome, suite, failure_type, message, detail)])
+
+    # Append many rows, with the per-row lookups bound once
+    def extend(self, rows):
+        names, codes, times, outcomes, suite_codes = (
+            self._names.append, self._codes.append, self._times.append, self._outcomes.append, self._suite_codes.append
+        )
+        classname_index, intern = self._classnames.index, sys.intern
+        last_suite = last_suite_code = None
+        row = len(self._times)
+        for name, classname, time, outcome, suite, failure_type, message, detail in rows:
+            names(intern(name))
+            code = classname_index.get(classname)
+            codes(self._classnames.code(classname) if code is None else code)
+            times(time)
+            outcomes(outcome)
+            # Consecutive rows nearly always share a suite
+            if suite != last_suite:
+                last_suite, last_suite_code = suite, self._suites.code(suite)
+            suite_codes(last_suite_code)
+            if failure_type or message or detail:
+                self._failures[row] = (self._types.code(failure_type), message, detail[:DETAIL_CHARS])
+            row += 1
+
+    def build(self):
+        outcomes = np.frombuffer(self._outcomes, dtype=np.uint8)
+        type_codes = np.zeros(len(outcomes), dtype=np.int32)
+        messages = np.full(len(outcomes), "", dtype=object)
+        details = np.full(len(outcomes), "", dtype=object)
+        for row, (type_code, message, detail) in self._failures.items():
+            type_codes[row] = type_code
+            messages[row] = message
+            details[row] = detail
+        return TestCaseTable(
+            np.array(self._names, dtype=object),
+            np.frombuffer(self._codes, dtype=np.int32),
+            list(self._classnames.values),
+            np.frombuffer(self._times, dtype=np.float64),
+            (outcomes == FAILED) | (outcomes == ERROR),
+            outcomes,
+            np.frombuffer(self._suite_codes, dtype=np.int32),
+            list(self._suites.values),
+            type_codes,
+            list(self._types.values),
+            messages,
+            details,
+        )
+
+
+# Interned category list with a reverse index, for the code columns
+class _Categories:
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def code(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(sys.intern(value))
+        return code
+
+    # Codes of another table's categories in this list, for remapping a
+    # whole code column with one vectorized lookup
+    def mapping(self, values):
+        return np.fromiter((self.code(value) for value in values), dtype=np.int32, count=len(values))
+
+
+# Merge per-file tables into one, remapping each chunk's classname, suite and
+# type codes onto shared category lists with a single vectorized lookup per
+# chunk and column
+def concat_tables(tables):
+    tables = [table for table in tables if len(table)]
+    if not tables:
+        return TestCaseTableBuilder().build()
+    if len(tables) == 1:
+        return tables[0]
+
+    classnames, suites, types = _Categories(), _Categories(), _Categories()
+    classname_codes, suite_codes, type_codes = [], [], []
+    for table in tables:
+        classname_codes.append(classnames.mapping(table.classnames)[table.classname_codes])
+        suite_codes.append(suites.mapping(table.suites)[table.suite_codes])
+        type_codes.append(types.mapping(table.types)[table.type_codes])
+
+    return TestCaseTable(
+        np.concatenate([table.names for table in tables]),
+        np.concatenate(classname_codes),
+        classnames.values,
+        np.concatenate([table.times for table in tables]),
+        np.concatenate([table.failed for table in tables]),
+        np.concatenate([table.outcomes for table in tables]),
+        np.concatenate(suite_codes),
+        suites.values,
+        np.concatenate(type_codes),
+        types.values,
+        np.concatenate([table.messages for table in tables]),
+        np.concatenate([table.details for table in tables]),
+    )
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+
+from content_cache import sweep_dir, touch
+from results_table import OUTCOMES
+
+EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+INDEX_ROOT = os.environ.get("RETRIEVAL_INDEX_DIR", ".retrieval_index")
+# Least recently used indexes are removed past either limit when one is written
+INDEX_MAX_ENTRIES = int(os.environ.get("RETRIEVAL_INDEX_MAX_ENTRIES", "64"))
+INDEX_MAX_BYTES = int(os.environ.get("RETRIEVAL_INDEX_MAX_MB", "1024")) * 1024 * 1024
+
+
+# Embedding matrix plus the chunk texts it was built from. Vectors are stored
+# L2-normalised as float32 in vectors.npy and memory-mapped on open, so
+# search is one matrix-vector product over the mapped file. keys (None for
+# indexes written before they were kept) let a later run's index reuse the
+# vectors; embedded is how many chunks the last build sent to the model.
+class VectorIndex:
+    def __init__(self, path, vectors, chunks, keys=None):
+        self.path = path
+        self.vectors = vectors
+        self.chunks = chunks
+        self.keys = keys
+        self.embedded = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @classmethod
+    def open(cls, path):
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.json"), encoding="utf-8") as f:
+            chunks = json.load(f)
+        keys = None
+        if os.path.exists(os.path.join(path, "keys.json")):
+            with open(os.path.join(path, "keys.json"), encoding="utf-8") as f:
+                keys = json.load(f)
+        return cls(path, vectors, chunks, keys)
+
+    @classmethod
+    def write(cls, path, vectors, chunks, keys=None):
+        vectors = _normalise(np.asarray(vectors, dtype=np.float32))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "vectors.npy"), vectors)
+        with open(os.path.join(tmp_path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        if keys is not None:
+            with open(os.path.join(tmp_path, "keys.json"), "w", encoding="utf-8") as f:
+                json.dump(keys, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return cls.open(path)
+
+    # Top-k chunks by cosine similarity, best first, as (score, text) pairs
+    def search(self, query_vector, k=8):
+        if not len(self):
+            return []
+        query = _normalise(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# Split parsed results into retrievable text chunks: a summary chunk, then
+# per-classname chunks of up to chunk_size test cases with failures first
+def chunk_test_results(results, chunk_size=50, extra_texts=()):
+    return [text for text, _ in _chunks(results, chunk_size, extra_texts)]
+
+
+# Chunk texts with the table rows behind each (None for the summary and extra texts)
+def _chunks(results, chunk_size, extra_texts):
+    table = results["Test Cases"]
+    stats = table.stats()
+    chunks = [(
+        f"Summary: {results['Total Tests']} tests, {results['Passed Tests']} passed, "
+        f"{results['Failed Tests']} failed, {results['Skipped Tests']} skipped. Average time {stats['avg_time']:.2f}s, "
+        f"max {stats['max_time']:.2f}s, min {stats['min_time']:.2f}s.",
+        None,
+    )]
+    chunks.extend((text, None) for text in extra_texts)
+
+    # Group rows by classname, failed rows ahead of passed ones within a class
+    order = np.lexsort((~table.failed, table.classname_codes))
+    codes = table.classname_codes[order]
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    for group in np.split(order, boundaries):
+        if not len(group):
+            continue
+        classname = table.classnames[table.classname_codes[group[0]]]
+        for start in range(0, len(group), chunk_size):
+            rows = group[start:start + chunk_size]
+            lines = [f"Class {classname}:"]
+            for i in rows:
+                line = f"{table.names[i]} {OUTCOMES[table.outcomes[i]]} {table.times[i]:.3f}s"
+                if table.messages[i]:
+                    line += f": {table.messages[i]}"
+                lines.append(line)
+            chunks.append(("\n".join(lines), rows))
+    return chunks
+
+
+# Key a chunk's vector can be reused under: the embedding model and the tests
+# the chunk lists, in order. Text-only chunks are keyed by their text.
+def _chunk_key(model_key, table, text, rows):
+    digest = hashlib.sha256(f"{model_key}\0".encode())
+    if rows is None:
+        digest.update(text.encode())
+    else:
+        digest.update(table.classnames[table.classname_codes[rows[0]]].encode())
+        for i in rows.tolist():
+            digest.update(b"\0" + table.names[i].encode())
+    return digest.hexdigest()[:32]
+
+
+# Embed texts in batches, with batches in flight concurrently on the client.
+# progress(done, total) is called as each batch comes back.
+def embed_texts(client, texts, model=EMBED_MODEL, batch_size=64, progress=None):
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    done = 0
+
+    async def embed(batch):
+        nonlocal done
+        vectors = await client.aembed(model, batch)
+        done += len(batch)
+        if progress is not None:
+            progress(done, len(texts))
+        return vectors
+
+    async def run():
+        return await asyncio.gather(*(embed(batch) for batch in batches))
+
+    vectors = []
+    for batch_vectors in asyncio.run(run()):
+        vectors.extend(batch_vectors)
+    return vectors
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+
+# Build (or reuse) the on-disk index for a set of results. Indexes are keyed
+# by embedding provider and model and table fingerprint, so pushing the same run twice
+# costs nothing the second time. Given the index of an earlier run (base_path)
+# and the rows whose content is unchanged since it (stable, from run_diff),
+# only chunks listing a changed, added or reordered test are embedded again;
+# the others take their vector from the earlier index under the new text, as
+# only timing noise separates the two. progress is passed to embed_texts.
+def index_test_results(client, results, extra_texts=(), model=EMBED_MODEL, index_root=INDEX_ROOT, base_path=None, stable=None, progress=None):
+    table = results["Test Cases"]
+    digest = hashlib.sha256(table.fingerprint().encode())
+    digest.update(f"{results['Total Tests']}/{results['Failed Tests']}".encode())
+    for text in extra_texts:
+        digest.update(b"\0" + text.encode())
+    name = f"{client.provider}-{model}"
+    path = os.path.join(index_root, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{digest.hexdigest()[:40]}")
+    if os.path.exists(os.path.join(path, "chunks.json")):
+        index = open_index(path)
+        index.embedded = 0
+        return index
+
+    os.makedirs(index_root, exist_ok=True)
+    chunks = _chunks(results, 50, extra_texts)
+    keys = [_chunk_key(name, table, text, rows) for text, rows in chunks]
+    base = None
+    if base_path and stable is not None and os.path.exists(os.path.join(base_path, "chunks.json")):
+        base = open_index(base_path)
+    reusable = {key: i for i, key in enumerate(base.keys or ())} if base is not None else {}
+    reuse = [
+        reusable[key] if key in reusable and (rows is None or stable[rows].all()) else None
+        for key, (_, rows) in zip(keys, chunks)
+    ]
+    pending = [i for i, row in enumerate(reuse) if row is None]
+    embedded = embed_texts(client, [chunks[i][0] for i in pending], model, progress=progress)
+    dimensions = len(embedded[0]) if embedded else base.vectors.shape[1]
+    vectors = np.empty((len(chunks), dimensions), dtype=np.float32)
+    for i, vector in zip(pending, embedded):
+        vectors[i] = vector
+    for i, row in enumerate(reuse):
+        if row is not None:
+            vectors[i] = base.vectors[row]
+    index = VectorIndex.write(path, vectors, [text for text, _ in chunks], keys)
+    index.embedded = len(pending)
+    removed = sweep_dir(index_root, INDEX_MAX_ENTRIES, INDEX_MAX_BYTES, keep=path)
+    with _open_lock:
+        for old in removed:
+            _open_indexes.pop(old, None)
+        _open_indexes[path] = index
+    return index
+
+
+# An index that has been swept away raises FileNotFoundError
+def open_index(path):
+    touch(path)
+    with _open_lock:
+        index = _open_indexes.get(path)
+        if index is None:
+            index = _open_indexes[path] = VectorIndex.open(path)
+        return index
+
+
+# Embed the question and return the k most relevant chunks as prompt context
+def retrieve_context(client, index, question, k=8, model=EMBED_MODEL):
+    query_vector = client.embed(model, [question])[0]
+    return "\n\n".join(text for _, text in index.search(query_vector, k))
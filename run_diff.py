@@ -0,0 +1,151 @@
+import zlib
+from itertools import repeat
+
+import numpy as np
+
+import failure_triage
+from results_table import OUTCOMES, PASSED
+
+# Delta between two parsed runs of the same suite. Test cases are matched on
+# (classname, name) and fingerprinted by outcome and a hash of their
+# normalised failure, so a re-run of 50k tests where a few dozen changed
+# comes down to those few dozen rows. Timings jitter on every run, so a time
+# change only counts past both thresholds below.
+TIME_RATIO = 0.5
+MIN_TIME_DELTA = 0.1
+
+# Change kinds, most important first; rows are listed in this order
+CHANGES = ["newly failing", "failure changed", "fixed", "outcome changed", "slower", "faster", "added", "removed"]
+NEWLY_FAILING, FAILURE_CHANGED, FIXED, OUTCOME_CHANGED, SLOWER, FASTER, ADDED, REMOVED = range(len(CHANGES))
+
+# Changed tests sent to the model; the summary line still counts all of them
+MAX_PROMPT_CHANGES = 100
+
+CHANGES_PROMPT = (
+    "A test suite was run again. {summary}\n\nChanged tests:\n{changes}\n\n"
+    "In a few sentences, explain what changed between the two runs, the most likely cause and what to look at first."
+)
+
+
+# Identity of each row, the key run history uses too
+def case_keys(table):
+    classnames = table.classnames
+    return [f"{classnames[code]}\0{name}" for code, name in zip(table.classname_codes.tolist(), table.names)]
+
+
+# Hash of a failed row's type and normalised message, so ids, addresses and
+# numbers in the message do not make an unchanged failure look new
+def failure_hash(table, row):
+    text = f"{table.types[table.type_codes[row]]}\0{failure_triage.normalize(table.messages[row])}"
+    return zlib.crc32(text.encode())
+
+
+# previous and current are TestCaseTables. matched gives each current row's
+# previous row (-1 when added), change its change code (-1 when unchanged),
+# and removed the previous rows whose test is gone.
+class RunDiff:
+    def __init__(self, previous, current, matched, change, removed):
+        self.previous = previous
+        self.current = current
+        self.matched = matched
+        self.change = change
+        self.removed = removed
+
+    # Current rows whose content is as it was, for reusing derived data
+    def stable(self):
+        return self.change < 0
+
+    def counts(self):
+        counts = np.bincount(self.change[self.change >= 0], minlength=len(CHANGES))
+        counts[REMOVED] = len(self.removed)
+        result = {name: int(count) for name, count in zip(CHANGES, counts)}
+        result["unchanged"] = int(np.count_nonzero(self.change < 0))
+        return result
+
+    def summary(self):
+        counts = self.counts()
+        changes = [f"{counts[name]} {name}" for name in CHANGES if counts[name]]
+        if not changes:
+            return f"Nothing changed since the previous run ({counts['unchanged']} tests)."
+        return f"Since the previous run: {', '.join(changes)}; {counts['unchanged']} unchanged."
+
+    # One row per changed test, most important changes first, then removed tests
+    def rows(self, limit=None):
+        changed = np.flatnonzero(self.change >= 0)
+        changed = changed[np.argsort(self.change[changed], kind="stable")]
+        rows = [self._row(self.current, row, CHANGES[self.change[row]], self.matched[row]) for row in changed[:limit].tolist()]
+        if limit is None or len(rows) < limit:
+            room = None if limit is None else limit - len(rows)
+            rows.extend(self._row(self.previous, row, "removed", row) for row in self.removed[:room].tolist())
+        return rows
+
+    def _row(self, table, row, change, before):
+        return {
+            "test": f"{table.classnames[table.classname_codes[row]]}.{table.names[row]}",
+            "change": change,
+            "before": OUTCOMES[self.previous.outcomes[before]] if before >= 0 else "",
+            "after": "" if change == "removed" else OUTCOMES[table.outcomes[row]],
+            "time_before": float(self.previous.times[before]) if before >= 0 else None,
+            "time_after": None if change == "removed" else float(table.times[row]),
+            "message": table.messages[row],
+        }
+
+    # Prompt with the summary and only the changed tests
+    def prompt(self, limit=MAX_PROMPT_CHANGES):
+        lines = []
+        for row in self.rows(limit):
+            line = f"{row['test']}: {row['change']}"
+            if row["before"] or row["after"]:
+                line += f" ({row['before'] or 'new'} -> {row['after'] or 'gone'})"
+            if row["time_before"] is not None and row["change"] in ("slower", "faster"):
+                line += f" {row['time_before']:.3f}s -> {row['time_after']:.3f}s"
+            if row["message"]:
+                line += f": {row['message']}"
+            lines.append(line)
+        total = int(np.count_nonzero(self.change >= 0)) + len(self.removed)
+        if total > len(lines):
+            lines.append(f"... and {total - len(lines)} more")
+        return CHANGES_PROMPT.format(summary=self.summary(), changes="\n".join(lines))
+
+
+# Compare two TestCaseTables. Everything but the failure hashes is one
+# vectorized pass; those are only computed for rows that failed in both runs.
+def diff_runs(previous, current):
+    previous_keys = case_keys(previous)
+    # A test listed twice keeps its last row, as in run history
+    index = dict(zip(previous_keys, range(len(previous_keys))))
+    current_keys = case_keys(current)
+    matched = np.fromiter(map(index.get, current_keys, repeat(-1)), dtype=np.int64, count=len(current_keys))
+    current_set = set(current_keys)
+    removed = np.flatnonzero([key not in current_set for key in previous_keys])
+
+    change = np.full(len(current), ADDED, dtype=np.int8)
+    found = np.flatnonzero(matched >= 0)
+    before = matched[found]
+    codes = np.full(len(found), -1, dtype=np.int8)
+
+    was_failed, is_failed = previous.failed[before], current.failed[found]
+    was, now = previous.outcomes[before], current.outcomes[found]
+    differs = was != now
+    codes[differs] = OUTCOME_CHANGED
+    codes[is_failed & ~was_failed] = NEWLY_FAILING
+    codes[was_failed & (now == PASSED)] = FIXED
+
+    for i in np.flatnonzero(~differs & is_failed).tolist():
+        old, new = before[i], found[i]
+        # Most failures repeat word for word; only normalise the ones that do not
+        same = (
+            previous.messages[old] == current.messages[new]
+            and previous.types[previous.type_codes[old]] == current.types[current.type_codes[new]]
+        )
+        if not same and failure_hash(previous, old) != failure_hash(current, new):
+            codes[i] = FAILURE_CHANGED
+
+    old_time, new_time = previous.times[before], current.times[found]
+    delta = new_time - old_time
+    significant = (codes < 0) & (np.abs(delta) >= np.maximum(MIN_TIME_DELTA, TIME_RATIO * old_time))
+    codes[significant & (delta > 0)] = SLOWER
+    codes[significant & (delta < 0)] = FASTER
+
+    change[found] = codes
+    return RunDiff(previous, current, matched, change, removed)
@@ -0,0 +1,243 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from results_table import OUTCOMES, SKIPPED
+
+HISTORY_PATH = os.environ.get("RUN_HISTORY_PATH", ".run_history.sqlite3")
+
+# Version 2 stores each result's outcome code, not just whether it failed
+SCHEMA_VERSION = 2
+
+
+# Per-run, per-test-case results across many builds, in SQLite. Tests get a
+# stable id from (classname, name); results are clustered by (test_id, run_id)
+# so one test's history is a single range scan, and indexed by run_id so the
+# last N runs can be pulled out without touching older ones. Skipped results
+# are stored but left out of time baselines, flip counts and running totals:
+# a skipped test took no time and neither passed nor failed.
+class RunHistory:
+    def __init__(self, path=HISTORY_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "PRAGMA journal_mode = WAL;"
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY, key TEXT UNIQUE, label TEXT, ingested REAL,"
+            " total INTEGER, failed INTEGER);"
+            "CREATE TABLE IF NOT EXISTS tests ("
+            " id INTEGER PRIMARY KEY, classname TEXT, name TEXT, UNIQUE (classname, name));"
+            "CREATE TABLE IF NOT EXISTS results ("
+            " test_id INTEGER, run_id INTEGER, time REAL, failed INTEGER, outcome INTEGER,"
+            " PRIMARY KEY (test_id, run_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS results_run ON results (run_id);"
+            # Running per-test totals, kept up to date on ingest so whole-history
+            # questions read one row per test instead of every result
+            "CREATE TABLE IF NOT EXISTS test_stats ("
+            " test_id INTEGER PRIMARY KEY, runs INTEGER, failures INTEGER, flips INTEGER,"
+            " total_time REAL, last_run INTEGER, last_failed INTEGER);"
+        )
+        self._migrate()
+        self._test_ids = None
+        self._max_test_id = 0
+
+    # Bring a history written by an older version up to SCHEMA_VERSION. Version
+    # 1 results only knew failed or not, which are the PASSED and FAILED codes.
+    def _migrate(self):
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(results)")]
+        with self._db:
+            if "outcome" not in columns:
+                self._db.execute("ALTER TABLE results ADD COLUMN outcome INTEGER")
+                self._db.execute("UPDATE results SET outcome = failed")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # Identity of a run: its rows and totals, so re-uploading the same files
+    # does not record a second build
+    @staticmethod
+    def run_key(results):
+        digest = hashlib.sha256(results["Test Cases"].fingerprint().encode())
+        digest.update(f"{results['Total Tests']}/{results['Failed Tests']}".encode())
+        return digest.hexdigest()
+
+    # Record one parsed run (the parse_test_results dict). Ingest is
+    # incremental and idempotent: a run already stored returns its id, and
+    # only test identities not seen before are inserted. A test case that
+    # appears twice in one run keeps its last row.
+    def ingest(self, results, label=None):
+        key = self.run_key(results)
+        table = results["Test Cases"]
+        with self._lock:
+            row = self._db.execute("SELECT id FROM runs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                return row[0]
+
+            test_ids = self._load_test_ids()
+            identities = [
+                (table.classnames[code], name) for code, name in zip(table.classname_codes.tolist(), table.names)
+            ]
+            new = list(dict.fromkeys(identity for identity in identities if identity not in test_ids))
+            with self._db:
+                self._db.executemany("INSERT OR IGNORE INTO tests (classname, name) VALUES (?, ?)", new)
+                if new:
+                    test_ids.update(
+                        ((classname, name), test_id)
+                        for test_id, classname, name in self._db.execute(
+                            "SELECT id, classname, name FROM tests WHERE id > ?", (self._max_test_id,)
+                        )
+                    )
+                    self._max_test_id = max(test_ids.values())
+                cursor = self._db.execute(
+                    "INSERT INTO runs (key, label, ingested, total, failed) VALUES (?, ?, ?, ?, ?)",
+                    (key, label, time.time(), results["Total Tests"], results["Failed Tests"]),
+                )
+                run_id = cursor.lastrowid
+                rows = list(zip(
+                    (test_ids[identity] for identity in identities),
+                    [run_id] * len(identities),
+                    table.times.tolist(),
+                    table.failed.astype(np.int8).tolist(),
+                    table.outcomes.tolist(),
+                ))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO results (test_id, run_id, time, failed, outcome) VALUES (?, ?, ?, ?, ?)", rows
+                )
+                # Run ids only grow, so this run is always the newest one a
+                # test has been seen in
+                self._db.executemany(
+                    "INSERT INTO test_stats (test_id, runs, failures, flips, total_time, last_run, last_failed)"
+                    " VALUES (?1, 1, ?4, 0, ?3, ?2, ?4) ON CONFLICT (test_id) DO UPDATE SET"
+                    " runs = runs + 1, failures = failures + ?4, total_time = total_time + ?3,"
+                    " flips = flips + (?4 != last_failed), last_run = ?2, last_failed = ?4",
+                    {row[0]: row[:4] for row in rows if row[4] != SKIPPED}.values(),
+                )
+            return run_id
+
+    def _load_test_ids(self):
+        if self._test_ids is None:
+            self._test_ids = {
+                (classname, name): test_id
+                for test_id, classname, name in self._db.execute("SELECT id, classname, name FROM tests")
+            }
+            self._max_test_id = max(self._test_ids.values(), default=0)
+        return self._test_ids
+
+    def runs(self, last=50):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, label, ingested, total, failed FROM runs ORDER BY id DESC LIMIT ?", (last,)
+            ).fetchall()
+        return [
+            {"run_id": run_id, "label": label, "ingested": ingested, "total": total, "failed": failed}
+            for run_id, label, ingested, total, failed in reversed(rows)
+        ]
+
+    # Smallest run id among the last `last` runs up to and including `until`
+    def _window_start(self, last, until=None):
+        row = self._db.execute(
+            "SELECT MIN(id) FROM (SELECT id FROM runs WHERE id <= COALESCE(?, id) ORDER BY id DESC LIMIT ?)",
+            (until, last),
+        ).fetchone()
+        return row[0] or 0
+
+    # One test's time and status over the last `last` runs, oldest first
+    def duration_trend(self, classname, name, last=50):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT r.run_id, runs.label, r.time, r.outcome FROM results r"
+                " JOIN tests t ON t.id = r.test_id JOIN runs ON runs.id = r.run_id"
+                " WHERE t.classname = ? AND t.name = ? AND r.run_id >= ? ORDER BY r.run_id",
+                (classname, name, self._window_start(last)),
+            ).fetchall()
+        return [
+            {"run_id": run_id, "label": label, "time": duration, "status": OUTCOMES[outcome]}
+            for run_id, label, duration, outcome in rows
+        ]
+
+    # Tests whose time in run_id (the latest run by default) is at least
+    # `factor` times their average over the earlier runs in the window,
+    # biggest regressions first. last=None compares against the whole history
+    # from the running totals, which only works for each test's newest run.
+    # Skipped results are neither measured nor part of a baseline.
+    def slowdowns(self, run_id=None, last=50, factor=3.0, min_time=0.1, limit=50):
+        with self._lock:
+            latest = run_id or self._db.execute("SELECT MAX(id) FROM runs").fetchone()[0]
+            if latest is None:
+                return []
+            if last is None:
+                baseline = (
+                    "SELECT test_id, (total_time - time) / (runs - 1) AS avg_time, runs - 1 AS runs"
+                    " FROM test_stats JOIN results USING (test_id)"
+                    " WHERE run_id = ?3 AND last_run = ?3 AND runs > 1"
+                )
+            else:
+                baseline = (
+                    "SELECT test_id, AVG(time) AS avg_time, COUNT(*) AS runs FROM results"
+                    " WHERE run_id >= ?4 AND run_id < ?3 AND outcome != ?6 GROUP BY test_id"
+                )
+            rows = self._db.execute(
+                "SELECT t.classname, t.name, cur.time, base.avg_time, base.runs"
+                f" FROM ({baseline}) base"
+                " JOIN results cur ON cur.test_id = base.test_id AND cur.run_id = ?3"
+                " JOIN tests t ON t.id = base.test_id"
+                " WHERE cur.time >= ?1 AND cur.time >= ?2 * base.avg_time AND cur.outcome != ?6"
+                " ORDER BY cur.time / MAX(base.avg_time, 1e-9) DESC LIMIT ?5",
+                (min_time, factor, latest, self._window_start((last or 0) + 1, latest), limit, SKIPPED),
+            ).fetchall()
+        return [
+            {
+                "classname": classname, "name": name, "time": duration, "baseline": baseline,
+                "ratio": duration / baseline if baseline else float("inf"), "runs": runs,
+            }
+            for classname, name, duration, baseline, runs in rows
+        ]
+
+    # Tests that flip between PASSED and FAILED across the last `last` runs,
+    # or across the whole history when last is None. Skipped runs are passed
+    # over, so pass, skip, pass is not a flip. flip_rate is flips per
+    # consecutive pair of runs the test appeared in.
+    def flaky_tests(self, last=50, min_flips=2, limit=50):
+        with self._lock:
+            if last is None:
+                rows = self._db.execute(
+                    "SELECT t.classname, t.name, s.flips, s.failures, s.runs FROM test_stats s"
+                    " JOIN tests t ON t.id = s.test_id WHERE s.flips >= ?"
+                    " ORDER BY s.flips DESC, s.failures DESC LIMIT ?",
+                    (min_flips, limit),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT t.classname, t.name, f.flips, f.failures, f.runs FROM ("
+                    "  SELECT test_id, SUM(failed != prev) AS flips, SUM(failed) AS failures, COUNT(*) AS runs"
+                    "  FROM (SELECT test_id, failed, LAG(failed) OVER (PARTITION BY test_id ORDER BY run_id) AS prev"
+                    "        FROM results WHERE run_id >= ? AND outcome != ?)"
+                    "  GROUP BY test_id HAVING flips >= ?) f"
+                    " JOIN tests t ON t.id = f.test_id"
+                    " ORDER BY f.flips DESC, f.failures DESC LIMIT ?",
+                    (self._window_start(last), SKIPPED, min_flips, limit),
+                ).fetchall()
+        return [
+            {
+                "classname": classname, "name": name, "flips": flips, "failures": failures, "runs": runs,
+                "flip_rate": flips / (runs - 1) if runs > 1 else 0.0,
+            }
+            for classname, name, flips, failures, runs in rows
+        ]
+
+
+_default_history = None
+_default_lock = threading.Lock()
+
+
+def get_history():
+    global _default_history
+    with _default_lock:
+        if _default_history is None:
+            _default_history = RunHistory()
+        return _default_history
@@ -0,0 +1,17 @@
+# Plain-text summaries of parsed results, shared by the Streamlit apps and
+# the headless batch runner
+
+# Generate graph summaries
+def generate_graph_summaries(results):
+    stats = results["Test Cases"].stats()
+    pass_count = stats["passed"]
+    fail_count = stats["failed"]
+    error_count = stats["errors"]
+    skip_count = stats["skipped"]
+    avg_time = stats["avg_time"]
+    max_time = stats["max_time"]
+    min_time = stats["min_time"]
+
+    summary = f"Test Summary:\nTotal Tests: {results['Total Tests']}\nPassed: {pass_count}\nFailed: {fail_count} ({error_count} errors)\nSkipped: {skip_count}\nAverage Execution Time: {avg_time:.2f}s\nMax Execution Time: {max_time:.2f}s\nMin Execution Time: {min_time:.2f}s\n"
+    
+    return summary
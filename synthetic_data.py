@@ -0,0 +1,69 @@
+import random
+from xml.sax.saxutils import quoteattr
+
+# Synthetic inputs for benchmarks and load testing: JUnit XML with a
+# configurable size, failure ratio, failure body size and suite nesting, and
+# Excel sheets in the audit workbook schema (S_No, Expected_Status,
+# Actual_Status, URL, Description, Status). Output is deterministic per seed.
+
+EXCEL_COLUMNS = ["S_No", "Expected_Status", "Actual_Status", "URL", "Description", "Status"]
+
+
+# Write a JUnit report of `tests` test cases to path. Test cases are spread
+# over `suites` <testsuite> elements under a <testsuites> root, each wrapped
+# in `depth` levels of nested suites; with suites=0 the test cases sit
+# directly under a single root <testsuite>. Failed cases carry a <failure>
+# with a body of about failure_body bytes.
+def write_junit_xml(path, tests=1000, failure_ratio=0.1, failure_body=200, suites=0, depth=1, classes=20, seed=0):
+    rng = random.Random(seed)
+    failed = set(rng.sample(range(tests), round(tests * failure_ratio)))
+    trace = ("at com.example.Module.method(Module.java:42)\n" * (failure_body // 44 + 1))[:failure_body]
+
+    def cases(start, stop):
+        for i in range(start, stop):
+            classname = f"com.example.pkg{i % classes}.Test{i % (classes * 5)}"
+            attributes = f'name="test_{i}" classname="{classname}" time="{rng.expovariate(4):.3f}"'
+            if i in failed:
+                message = quoteattr(f"expected {i} but was {i + 1}")
+                yield f"<testcase {attributes}><failure message={message} type=\"AssertionError\">{trace}</failure></testcase>\n"
+            else:
+                yield f"<testcase {attributes}/>\n"
+
+    with open(path, "w", encoding="utf-8") as out:
+        if not suites:
+            out.write(f'<testsuite name="synthetic" tests="{tests}" failures="{len(failed)}">\n')
+            out.writelines(cases(0, tests))
+            out.write("</testsuite>\n")
+            return
+        out.write(f'<testsuites tests="{tests}" failures="{len(failed)}">\n')
+        bounds = [round(tests * i / suites) for i in range(suites + 1)]
+        for suite, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+            suite_failures = len(failed.intersection(range(start, stop)))
+            for level in range(depth):
+                out.write(f'<testsuite name="suite{suite}.{level}" tests="{stop - start}" failures="{suite_failures}">\n')
+            out.writelines(cases(start, stop))
+            out.write("</testsuite>\n" * depth)
+        out.write("</testsuites>\n")
+
+
+# Write an audit-style workbook of `rows` rows. Rows fail when the actual
+# status code differs from the expected one, like the real exports.
+def write_excel(path, rows=10000, failure_ratio=0.1, seed=0):
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(EXCEL_COLUMNS)
+    for i in range(rows):
+        expected = rng.choice((200, 200, 200, 400, 422))
+        actual = rng.choice((500, 404)) if rng.random() < failure_ratio else expected
+        sheet.append([
+            f"Fetch_Audit_Filters_{i + 1:06d}",
+            expected,
+            actual,
+            f"https://api.example.com/audit/filters?page={i}",
+            f"Synthetic case {i}",
+            "Passed" if actual == expected else "Failed",
+        ])
+    workbook.save(path)
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from results_table import OUTCOMES
+
+# Filtered, sorted and paginated access to a TestCaseTable, for showing runs
+# of any size one page at a time. Sort orders are permutations computed once
+# per column and reused; the classname filter is matched once per distinct
+# classname and spread over the rows by code; test names are searched in one
+# lowercased byte buffer of all of them. A query over a million rows is a few
+# vectorized passes, and only the rows of the page asked for are turned into
+# a DataFrame.
+
+SORTS = ["run order", "time", "status", "classname", "name"]
+PAGE_SIZE = 100
+
+
+class TableView:
+    def __init__(self, table):
+        self.table = table
+        self._orders = {}
+        self._classnames = [classname.lower() for classname in table.classnames]
+        self._names = None
+        self._starts = None
+        self._frequency = None
+        self._last = None
+
+    # Row order for a sort column, ascending and stable, built on first use.
+    # Classname sorts by classname then name, like the report itself.
+    def order(self, sort):
+        order = self._orders.get(sort)
+        if order is not None:
+            return order
+        table = self.table
+        if sort == "run order":
+            order = np.arange(len(table))
+        elif sort == "time":
+            order = np.argsort(table.times, kind="stable")
+        elif sort == "status":
+            order = np.argsort(table.outcomes, kind="stable")
+        elif sort == "name":
+            order = np.argsort(table.names, kind="stable")
+        elif sort == "classname":
+            # Rank the few distinct classnames once, then sort rows by rank with
+            # name order breaking ties
+            ranks = np.argsort(np.argsort(np.array(table.classnames, dtype=object), kind="stable"))
+            by_name = self.order("name")
+            order = by_name[np.argsort(ranks[table.classname_codes[by_name]], kind="stable")]
+        else:
+            raise ValueError(f"Unknown sort: {sort}")
+        self._orders[sort] = order
+        return order
+
+    # Rows whose classname or name contains text, ignoring case
+    def _text_mask(self, text):
+        text = text.lower().replace("\0", "")
+        mask = np.fromiter((text in classname for classname in self._classnames), dtype=bool, count=len(self._classnames))
+        mask = mask[self.table.classname_codes] if len(mask) else np.zeros(len(self.table), dtype=bool)
+        if text and len(self.table):
+            mask |= self._name_mask(np.frombuffer(text.encode(), dtype=np.uint8))
+        return mask
+
+    # Substring search over the UTF-8 bytes of every name at once. Candidates
+    # are the positions of the pattern's rarest byte, narrowed by one gather
+    # per remaining byte; NUL separators keep a match inside one name.
+    def _name_mask(self, pattern):
+        if self._names is None:
+            self._names = np.frombuffer(("\0".join(self.table.names) + "\0").lower().encode(), dtype=np.uint8)
+            self._starts = np.concatenate([[0], np.flatnonzero(self._names == 0)[:-1] + 1])
+            self._frequency = np.bincount(self._names, minlength=256)
+        names = self._names
+        anchor = int(np.argmin(self._frequency[pattern]))
+        hits = np.flatnonzero(names == pattern[anchor]) - anchor
+        hits = hits[(hits >= 0) & (hits <= len(names) - len(pattern))]
+        for offset, byte in enumerate(pattern.tolist()):
+            if offset != anchor:
+                hits = hits[names[hits + offset] == byte]
+        # Many hits are cheaper to fold per name than to look up one by one
+        if len(hits) * 8 > len(self._starts):
+            found = np.zeros(len(names), dtype=bool)
+            found[hits] = True
+            return np.logical_or.reduceat(found, self._starts)
+        mask = np.zeros(len(self._starts), dtype=bool)
+        mask[np.searchsorted(self._starts, hits, side="right") - 1] = True
+        return mask
+
+    # Rows matching the filters, in sort order. statuses is a list of OUTCOMES
+    # names (all when empty); min_time and max_time bound the time in seconds.
+    # The last query is kept, so paging through its result costs nothing.
+    def query(self, statuses=(), text="", min_time=None, max_time=None, sort="run order", descending=False):
+        key = (tuple(statuses), text, min_time, max_time, sort, descending)
+        if self._last is not None and self._last[0] == key:
+            return self._last[1]
+        table = self.table
+        mask = None
+        if statuses:
+            wanted = np.zeros(len(OUTCOMES), dtype=bool)
+            wanted[[OUTCOMES.index(status) for status in statuses]] = True
+            mask = wanted[table.outcomes]
+        if min_time is not None:
+            mask = _and(mask, table.times >= min_time)
+        if max_time is not None:
+            mask = _and(mask, table.times <= max_time)
+        if text:
+            mask = _and(mask, self._text_mask(text))
+        order = self.order(sort)
+        if descending:
+            order = order[::-1]
+        rows = order if mask is None else order[mask[order]]
+        self._last = (key, rows)
+        return rows
+
+    # One page of the rows from query() as a DataFrame
+    def page(self, rows, page=0, page_size=PAGE_SIZE):
+        table = self.table
+        rows = rows[page * page_size:(page + 1) * page_size]
+        return pd.DataFrame(
+            {
+                "classname": [table.classnames[code] for code in table.classname_codes[rows]],
+                "name": table.names[rows],
+                "time": table.times[rows],
+                "status": [OUTCOMES[outcome] for outcome in table.outcomes[rows]],
+                "message": table.messages[rows],
+            },
+            index=rows,
+        )
+
+
+def _and(mask, other):
+    return other if mask is None else mask & other
+
+
+def page_count(rows, page_size=PAGE_SIZE):
+    return max(1, -(-len(rows) // page_size))
@@ -0,0 +1,101 @@
+import io
+
+import numpy as np
+
+from results_table import OUTCOMES, PASSED, SKIPPED
+
+# Compact text encoding of parsed test results for prompts. The repr of the
+# records repeats every key and quotes every value on every row; here the
+# column header is written once, classnames (and suites, when there is more
+# than one) are numbered in tables of their own that rows refer to, statuses
+# are one letter, times are whole milliseconds, and failed, errored and
+# skipped tests come before the passed ones so a truncated prompt keeps what
+# matters. Rows are written in
+# batches to any file-like object, so a large run never has to exist as one
+# string unless the caller asks for one.
+
+BATCH_ROWS = 10000
+
+# A failure message is one line in the prompt; long ones are cut
+MESSAGE_CHARS = 300
+
+# Statuses by their first letter: P, F, E and S
+LETTERS = np.array([outcome[0] for outcome in OUTCOMES], dtype=object)
+
+# Row order: failures and errors, then skips, then passes, in run order within each
+_RANK = np.zeros(len(OUTCOMES), dtype=np.int8)
+_RANK[SKIPPED] = 1
+_RANK[PASSED] = 2
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _escape(text):
+    if len(text) > MESSAGE_CHARS:
+        text = text[:MESSAGE_CHARS] + "..."
+    return text.translate(_ESCAPES)
+
+
+# Write the encoding of a results dict to out. max_rows caps the test rows
+# written (the rest are counted in a closing line). Returns the rows written.
+def write_test_cases(results, out, max_rows=None, batch_size=BATCH_ROWS):
+    table = results["Test Cases"]
+    stats = table.stats()
+    out.write(
+        f"JUnit run: {stats['total']} tests, {stats['passed']} passed, {stats['failed'] - stats['errors']} failed, "
+        f"{stats['errors']} errors, {stats['skipped']} skipped.\n"
+        "Status: F=failed E=error S=skipped P=passed. ms is the time in milliseconds.\n"
+    )
+    order = np.argsort(_RANK[table.outcomes], kind="stable")
+    if max_rows is not None:
+        order = order[:max_rows]
+
+    # Only the classnames and suites of the rows written are listed, numbered
+    # in the order they are listed
+    classnames, class_codes = _renumber(table.classname_codes[order], table.classnames)
+    out.write("Classes:\n")
+    out.write("".join(f"{code}\t{classname}\n" for code, classname in enumerate(classnames)))
+    suites, suite_codes = _renumber(table.suite_codes[order], table.suites)
+    # A single-suite run (the common case) leaves the suite column out
+    with_suites = len(suites) > 1
+    if with_suites:
+        out.write("Suites:\n")
+        out.write("".join(f"{code}\t{suite}\n" for code, suite in enumerate(suites)))
+
+    header = "status\tsuite\tclass" if with_suites else "status\tclass"
+    out.write(f"Tests (failures first):\n{header}\tname\tms\tmessage\n")
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        prefixes = LETTERS[table.outcomes[rows]].tolist()
+        if with_suites:
+            prefixes = [
+                f"{letter}\t{code}" for letter, code in zip(prefixes, suite_codes[start:start + batch_size].tolist())
+            ]
+        lines = [
+            f"{prefix}\t{code}\t{name}\t{ms}\t{_escape(message)}\n" if message else f"{prefix}\t{code}\t{name}\t{ms}\n"
+            for prefix, code, name, ms, message in zip(
+                prefixes,
+                class_codes[start:start + batch_size].tolist(),
+                table.names[rows].tolist(),
+                np.rint(table.times[rows] * 1000).astype(np.int64).tolist(),
+                table.messages[rows].tolist(),
+            )
+        ]
+        out.write("".join(lines))
+    if len(order) < len(table):
+        out.write(f"... {len(table) - len(order)} more tests not listed\n")
+    return len(order)
+
+
+# The categories the given codes use, in code order, and the codes
+# renumbered to index into that shorter list
+def _renumber(codes, categories):
+    used, codes = np.unique(codes, return_inverse=True)
+    return [categories[code] for code in used.tolist()], codes
+
+
+# The encoding as one string
+def encode_test_cases(results, max_rows=None):
+    out = io.StringIO()
+    write_test_cases(results, out, max_rows)
+    return out.getvalue()